@@ -13,4 +13,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from chat.realtime import websocket_application
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
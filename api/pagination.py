@@ -0,0 +1,173 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds that DjangoJSONEncoder drops, so a cursor on a
+    datetime points exactly at its row.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over the ordering of the queryset.
+
+    The ordering may only use local fields or annotations and always ends
+    with the primary key, so every row has a unique position. A page is
+    fetched by filtering on the position of the previous one instead of
+    with OFFSET, so its cost does not grow with its depth. An index only
+    serves the condition when the ordering columns are stored and indexed
+    together; ordering by annotations still sorts the filtered rows.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset)
+        self.fields = self.get_fields(queryset)
+        position, reverse = self.decode_cursor(request)
+        ordering = self.invert(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position, ordering))
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        self.page = results[:self.limit]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        query = queryset.query
+        ordering = query.order_by or (query.get_meta().ordering if query.default_ordering else ())
+        ordering = [field for field in ordering if isinstance(field, str)]
+        fields = [field for field in ordering if field.lstrip('-') not in ('pk', 'id')]
+        keys = [field for field in ordering if field.lstrip('-') in ('pk', 'id')]
+        if keys:
+            key = '-pk' if keys[0].startswith('-') else 'pk'
+        else:
+            key = 'pk' if fields and not fields[-1].startswith('-') else '-pk'
+        return tuple(fields) + (key,)
+
+    def get_fields(self, queryset):
+        """
+        The model field or annotation output field behind each ordering
+        column, used to check the values of a cursor.
+        """
+        query = queryset.query
+        meta = query.get_meta()
+        fields = []
+        for name in self.ordering:
+            name = name.lstrip('-')
+            if name in query.annotations:
+                fields.append(query.annotations[name].output_field)
+            else:
+                fields.append(meta.pk if name == 'pk' else meta.get_field(name))
+        return fields
+
+    @staticmethod
+    def invert(ordering):
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in ordering
+        )
+
+    @staticmethod
+    def after(position, ordering):
+        conditions = []
+        for index, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equals = {
+                name.lstrip('-'): value
+                for name, value in zip(ordering[:index], position)
+            }
+            conditions.append(Q(**equals, **{f'{field.lstrip("-")}__{lookup}': position[index]}))
+        return reduce(or_, conditions)
+
+    def position(self, instance):
+        return [
+            getattr(instance, field.lstrip('-'))
+            for field in self.ordering
+        ]
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, cls=CursorEncoder)
+        cursor = urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode()))
+            position, reverse = payload['p'], bool(payload['r'])
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError(cursor)
+            position = [field.to_python(value) for field, value in zip(self.fields, position)]
+            if None in position:
+                raise ValueError(cursor)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.position(self.page[0]), True)
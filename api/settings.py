@@ -12,7 +12,6 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 from pathlib import Path
 import os
-import pagarme
 from django.utils.timezone import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,10 +31,32 @@ PRODUCTION = os.environ.get('PRODUCTION', False)
 
 # Payment settings
 
-pagarme.authentication_key(os.environ.get('PAGARME_API_KEY'))
-
 PAGARME_API_KEY = os.environ.get('PAGARME_API_KEY')
 
+PAGARME_API_URL = os.environ.get('PAGARME_API_URL', 'https://api.pagar.me/1')
+
+PAGARME_POOL_SIZE = int(os.environ.get('PAGARME_POOL_SIZE', 10))
+
+PAGARME_CACHE_TIMEOUT = int(os.environ.get('PAGARME_CACHE_TIMEOUT', 300))
+
+PAGARME_STALE_TIMEOUT = int(os.environ.get('PAGARME_STALE_TIMEOUT', 86400))
+
+PAGARME_MAX_CONCURRENCY = int(os.environ.get('PAGARME_MAX_CONCURRENCY', PAGARME_POOL_SIZE))
+
+PAGARME_QUEUE_TIMEOUT = float(os.environ.get('PAGARME_QUEUE_TIMEOUT', 0.5))
+
+PAGARME_BREAKER_THRESHOLD = int(os.environ.get('PAGARME_BREAKER_THRESHOLD', 5))
+
+PAGARME_BREAKER_RESET = float(os.environ.get('PAGARME_BREAKER_RESET', 30))
+
+PAYMENT_WORKERS = int(os.environ.get('PAYMENT_WORKERS', 4))
+
+PAYMENT_POLL_INTERVAL = float(os.environ.get('PAYMENT_POLL_INTERVAL', 30))
+
+PAYMENT_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_MAX_ATTEMPTS', 3))
+
+PAYMENT_PROFILE_TTL = int(os.environ.get('PAYMENT_PROFILE_TTL', 3600))
+
 PAGARME_CRYPTO = os.environ.get('PAGARME_CRYPTO')
 
 CONFIRMATION_LINK = os.environ.get('CONFIRMATION_LINK')
@@ -46,6 +67,20 @@ PAYMENT_DESCRIPTION = os.environ.get('PAYMENT_DESCRIPTION')
 
 PLATFORM_COMMISSION = os.environ.get('PLATFORM_COMMISSION', 0)
 
+# Chat settings
+
+CHAT_QUEUE_SIZE = int(os.environ.get('CHAT_QUEUE_SIZE', 100))
+
+CHAT_PARTICIPANTS_TIMEOUT = int(os.environ.get('CHAT_PARTICIPANTS_TIMEOUT', 60))
+
+# Search settings
+
+AVAILABILITY_HORIZON = int(os.environ.get('AVAILABILITY_HORIZON', 90))
+
+FACETS_CACHE_TIMEOUT = int(os.environ.get('FACETS_CACHE_TIMEOUT', 60))
+
+SEARCH_CACHE_TIMEOUT = int(os.environ.get('SEARCH_CACHE_TIMEOUT', 300))
+
 # Application definition
 
 HOST = os.environ.get('HOST', 'localhost')
@@ -75,6 +110,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'axes',
     'services',
@@ -146,6 +182,19 @@ DATABASES = {
         'PORT': os.environ.get('DB_PORT'),
     }
 }
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# The search results, the gateway lookups and the chat participants are
+# invalidated in this cache, so with several processes it must be shared
+# (memcached, redis, database) for a write to reach them all.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
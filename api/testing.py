@@ -0,0 +1,33 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Assertions for list endpoints that must run the same number of queries
+    however many rows they return.
+    """
+    budget_sizes = (10, 1000)
+
+    def count_queries(self, url, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context)
+
+    def assertConstantQueries(self, seed, url, **params):
+        """
+        Calls `seed(amount)` to grow the data set to each of the
+        `budget_sizes` and requires the same query count at every size.
+        """
+        counts, seeded = [], 0
+        for size in self.budget_sizes:
+            seed(size - seeded)
+            seeded = size
+            counts.append(self.count_queries(url, **params))
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'{url} ran {counts} queries for {self.budget_sizes} rows',
+        )
@@ -22,18 +22,22 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework import routers
 import core.routes
 import services.routes
+import financial.routes
+import chat.routes
 
 router = routers.DefaultRouter()
 
 core.routes.register(router)
 services.routes.register(router)
+financial.routes.register(router)
+chat.routes.register(router)
 
 urlpatterns = [
     path('auth/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/verify/', TokenVerifyView.as_view(), name='token_verify'),
-    path('postback/payment/<uuid:str>/', payment_postback),
-    path('postback/professional/<uuid:str>/', professional_postback),
+    path('postback/payment/<uuid:uuid>/', payment_postback),
+    path('postback/professional/<uuid:uuid>/', professional_postback),
     path('', include(router.urls)),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:33
+
+from django.db import migrations, models
+import uuid
+
+
+def fill_uuids(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    messages = list(Message.objects.only('pk'))
+    for message in messages:
+        message.uuid = uuid.uuid4()
+    Message.objects.bulk_update(messages, ['uuid'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='registration_date',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['job', 'registration_date', 'id'], name='chat_message_job_date_idx'),
+        ),
+    ]
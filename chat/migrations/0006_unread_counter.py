@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    UnreadCounter = apps.get_model('chat', 'UnreadCounter')
+    counters = {}
+    messages = Message.objects.order_by('id').values_list(
+        'id', 'job_id', 'sender_id', 'receiver_id', 'viewed', 'registration_date',
+    )
+    for pk, job_id, sender_id, receiver_id, viewed, date in messages.iterator():
+        for user_id, unread in ((receiver_id, not viewed), (sender_id, False)):
+            counter = counters.setdefault((job_id, user_id), UnreadCounter(job_id=job_id, user_id=user_id))
+            counter.unread += unread
+            counter.last_message_id = pk
+            counter.last_message_date = date
+    UnreadCounter.objects.bulk_create(counters.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('services', '0015_auto_20201206_1425'),
+        ('chat', '0005_message_uuid_and_job_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread', models.PositiveIntegerField(default=0)),
+                ('last_message_date', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to='services.job')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='unreadcounter',
+            index=models.Index(fields=['user', '-last_message_date', '-id'], name='chat_unread_inbox_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='unreadcounter',
+            constraint=models.UniqueConstraint(fields=('job', 'user'), name='chat_unread_job_user_uniq'),
+        ),
+    ]
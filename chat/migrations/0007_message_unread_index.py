@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_unread_counter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(viewed=False), fields=['job', 'receiver', 'registration_date'], name='chat_message_unread_idx'),
+        ),
+    ]
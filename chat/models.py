@@ -1,10 +1,17 @@
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
+import uuid
 
 User = get_user_model()
 
 class Message(models.Model):
+    uuid = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+    )
     receiver = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -16,7 +23,7 @@ class Message(models.Model):
         related_name='messages_sent',
     )
     registration_date = models.DateTimeField(
-        auto_now=True,
+        auto_now_add=True,
     )
     content = models.TextField()
     viewed = models.BooleanField(
@@ -29,7 +36,7 @@ class Message(models.Model):
     )
 
     def validate_user(self, user):
-        participants = (self.job.professional.user, self.job.user)
+        participants = (self.job.professional.user, self.job.client)
         if user not in participants:
             raise ValidationError(
                 'You are not participating in the chat'
@@ -42,7 +49,7 @@ class Message(models.Model):
         self.validate_user(self.sender)
 
     def validate_payment(self):
-        if not self.job.payment.is_valid() and self.job.payment.paid:
+        if not self.job.paid:
             raise ValidationError(
                 'Payment is required to send the message'
             )
@@ -56,4 +63,85 @@ class Message(models.Model):
     def __str__(self):
         return f'{self.sender} to {self.receiver}: {self.content[0:15]}'
     class Meta:
-        ordering = ['-registration_date']
\ No newline at end of file
+        ordering = ['-registration_date']
+        indexes = [
+            models.Index(fields=['job', 'registration_date', 'id'], name='chat_message_job_date_idx'),
+            models.Index(
+                fields=['job', 'receiver', 'registration_date'],
+                name='chat_message_unread_idx',
+                condition=Q(viewed=False),
+            ),
+        ]
+
+
+class UnreadCounter(models.Model):
+    """
+    One row per conversation and participant: how many messages the user
+    has not read and the last message of the conversation, kept up to
+    date when messages are sent and read so the inbox does not count.
+    """
+    job = models.ForeignKey(
+        'services.Job',
+        on_delete=models.CASCADE,
+        related_name='unread_counters',
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='unread_counters',
+    )
+    unread = models.PositiveIntegerField(
+        default=0,
+    )
+    last_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True,
+    )
+    last_message_date = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    @classmethod
+    def record(cls, message):
+        """
+        Counts a new message for its receiver and makes it the last message
+        of both participants, in one statement.
+        """
+        table = cls._meta.db_table
+        rows = [(message.receiver_id, 1)]
+        if message.sender_id != message.receiver_id:
+            rows.append((message.sender_id, 0))
+        # Both columns come from the same message, the latest by (date, id),
+        # so concurrent sends cannot pair one message with another's date.
+        newer = (
+            f'{table}.last_message_date IS NULL OR '
+            f'(EXCLUDED.last_message_date, EXCLUDED.last_message_id) > '
+            f'({table}.last_message_date, {table}.last_message_id)'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (job_id, user_id, unread, last_message_id, last_message_date)
+                VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))}
+                ON CONFLICT (job_id, user_id) DO UPDATE SET
+                    unread = {table}.unread + EXCLUDED.unread,
+                    last_message_id = CASE WHEN {newer}
+                        THEN EXCLUDED.last_message_id ELSE {table}.last_message_id END,
+                    last_message_date = CASE WHEN {newer}
+                        THEN EXCLUDED.last_message_date ELSE {table}.last_message_date END
+            """, [
+                value
+                for user_id, unread in rows
+                for value in (message.job_id, user_id, unread, message.pk, message.registration_date)
+            ])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'user'], name='chat_unread_job_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_date', '-id'], name='chat_unread_inbox_idx'),
+        ]
@@ -0,0 +1,55 @@
+"""
+Snapshot of a job as far as the chat needs it: its participants and
+whether it is paid.
+
+Sending a message validates against the snapshot instead of walking
+`job.payment`, `job.professional.user` and `job.client`. It is loaded
+with one query and kept in the default cache for
+`CHAT_PARTICIPANTS_TIMEOUT` seconds. Only paid jobs are cached, so a job
+can be chatted on as soon as it is paid, and saving the job or its
+payment drops the snapshot.
+
+The snapshot is dropped only from the cache of the process that saved
+the job. Other workers see the change as soon as the cache is shared
+(`CACHE_BACKEND`), and otherwise after the timeout, which is why it is
+short by default.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from services.models import Job
+
+
+def cache_key(job_uuid):
+    return f'chat:job:{job_uuid}'
+
+
+def load(job_uuid):
+    return Job.objects.select_related(
+        'client',
+        'professional__user',
+        'payment',
+    ).only(
+        'uuid',
+        'client__uuid',
+        'professional__user__uuid',
+        'payment__job',
+        'payment__paid',
+    ).filter(uuid=job_uuid).first()
+
+
+def get_job(job_uuid):
+    key = cache_key(job_uuid)
+    job = cache.get(key)
+    if job is None:
+        job = load(job_uuid)
+        if job is not None and job.paid:
+            cache.set(key, job, settings.CHAT_PARTICIPANTS_TIMEOUT)
+    return job
+
+
+def users(job):
+    return (job.client, job.professional.user)
+
+
+def forget(job_uuid):
+    cache.delete(cache_key(job_uuid))
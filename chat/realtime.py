@@ -0,0 +1,257 @@
+"""
+Real-time delivery of chat messages over WebSockets.
+
+A saved message is announced with Postgres `NOTIFY` once its transaction
+commits. Every worker process keeps one connection that `LISTEN`s on the
+channel and hands the messages to an in-process hub, which fans them out
+to the sockets open on the job. No broker is involved, and each message
+costs a worker at most one query, however many clients are listening.
+
+Each socket has a bounded queue. A client that falls behind is
+disconnected with code 1013 and should reconnect and catch up through
+the messages endpoint.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+import psycopg2
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.db.models import Q
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'chat_messages'
+# NOTIFY payloads must stay under 8000 bytes.
+MAX_PAYLOAD = 7900
+PATH_PREFIX = '/ws/jobs/'
+PATH_SUFFIX = '/messages/'
+OVERFLOW = object()
+
+
+class Subscriber:
+
+    def __init__(self, job, size):
+        self.job = job
+        self.queue = asyncio.Queue(maxsize=size)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Drop the backlog and leave the marker that closes the socket.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+
+class Hub:
+    """
+    Jobs and the sockets subscribed to them, in one process. It lives in
+    the event loop, and other threads publish through `dispatch`.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.subscribers = {}
+        self.listener = None
+
+    def subscribe(self, job, size=None):
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber(job, size or settings.CHAT_QUEUE_SIZE)
+        self.subscribers.setdefault(job, set()).add(subscriber)
+        if connection.vendor == 'postgresql' and (self.listener is None or not self.listener.is_alive()):
+            self.listener = Listener(self)
+            self.listener.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscribers = self.subscribers.get(subscriber.job, set())
+        subscribers.discard(subscriber)
+        if not subscribers:
+            self.subscribers.pop(subscriber.job, None)
+
+    def publish(self, job, message):
+        for subscriber in list(self.subscribers.get(job, ())):
+            subscriber.put(message)
+
+    def dispatch(self, job, message):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.publish, job, message)
+
+
+hub = Hub()
+
+
+class Listener(threading.Thread):
+    """
+    Waits for notifications on its own connection and passes them to the
+    hub, reconnecting when the connection drops.
+    """
+    daemon = True
+
+    def __init__(self, hub):
+        super().__init__(name='chat-listener')
+        self.hub = hub
+        self.stopped = threading.Event()
+        self.ready = threading.Event()
+
+    def connect(self):
+        params = connections['default'].get_connection_params()
+        listen = psycopg2.connect(**params)
+        listen.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        listen.cursor().execute(f'LISTEN {CHANNEL}')
+        return listen
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                listen = self.connect()
+            except psycopg2.Error:
+                logger.exception('Could not listen for chat messages')
+                time.sleep(1)
+                continue
+            self.ready.set()
+            try:
+                while not self.stopped.is_set():
+                    if select.select([listen], [], [], 1) == ([], [], []):
+                        continue
+                    listen.poll()
+                    while listen.notifies:
+                        self.receive(json.loads(listen.notifies.pop(0).payload))
+            except psycopg2.Error:
+                logger.exception('Lost the chat listener connection')
+            finally:
+                listen.close()
+
+    def receive(self, payload):
+        if payload['job'] not in self.hub.subscribers:
+            return
+        message = payload.get('message')
+        if message is None:
+            message = load(payload['uuid'])
+        if message is not None:
+            self.hub.dispatch(payload['job'], message)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def serialize(message):
+    from .serializers import MessageSerializer
+    return json.loads(json.dumps(MessageSerializer(message).data, cls=JSONEncoder))
+
+
+def load(message_uuid):
+    from .models import Message
+    close_old_connections()
+    try:
+        message = Message.objects.select_related('sender', 'receiver').filter(uuid=message_uuid).first()
+        return message and serialize(message)
+    finally:
+        connection.close()
+
+
+def publish(message):
+    """
+    Announces a saved message to every worker, or only to this process
+    when the database cannot notify.
+    """
+    job = str(message.job.uuid)
+    data = serialize(message)
+    if connection.vendor != 'postgresql':
+        hub.dispatch(job, data)
+        return
+    payload = json.dumps({'job': job, 'message': data})
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = json.dumps({'job': job, 'uuid': str(message.uuid)})
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+
+
+def authorize(token, job):
+    """
+    Returns the user of the token when they take part in the job.
+    """
+    from services.models import Job
+    close_old_connections()
+    try:
+        authentication = JWTAuthentication()
+        user = authentication.get_user(authentication.get_validated_token(token))
+    except (AuthenticationFailed, TokenError):
+        return None
+    participant = Job.objects.filter(
+        Q(client=user) | Q(professional__user=user),
+        uuid=job,
+    ).exists()
+    return user if participant else None
+
+
+def route(scope):
+    """
+    Returns the job uuid of a `/ws/jobs/<uuid>/messages/` path.
+    """
+    path = scope['path']
+    if not path.startswith(PATH_PREFIX) or not path.endswith(PATH_SUFFIX):
+        return None
+    try:
+        return str(uuid.UUID(path[len(PATH_PREFIX):-len(PATH_SUFFIX)]))
+    except ValueError:
+        return None
+
+
+def get_token(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][-1]
+    headers = dict(scope.get('headers', ()))
+    scheme, _, token = headers.get(b'authorization', b'').decode().partition(' ')
+    return token if scheme.lower() == 'bearer' else None
+
+
+async def websocket_application(scope, receive, send):
+    """
+    Serves `/ws/jobs/<uuid>/messages/?token=<access token>`. The socket
+    only pushes new messages, which are sent through the messages endpoint.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    job = route(scope)
+    token = get_token(scope)
+    user = job and token and await sync_to_async(authorize, thread_sensitive=True)(token, job)
+    if not user:
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    subscriber = hub.subscribe(job)
+    await send({'type': 'websocket.accept'})
+    receiving = asyncio.ensure_future(receive())
+    try:
+        while True:
+            getting = asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait((receiving, getting), return_when=asyncio.FIRST_COMPLETED)
+            if getting in done:
+                message = getting.result()
+                if message is OVERFLOW:
+                    await send({'type': 'websocket.close', 'code': 1013})
+                    return
+                await send({'type': 'websocket.send', 'text': json.dumps(message)})
+            else:
+                getting.cancel()
+            if receiving in done:
+                if receiving.result()['type'] == 'websocket.disconnect':
+                    return
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        receiving.cancel()
+        hub.unsubscribe(subscriber)
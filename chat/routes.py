@@ -0,0 +1,5 @@
+from . import views
+
+def register(router):
+    router.register(r'jobs/(?P<job_uuid>[^/.]+)/messages', views.MessageViewSet, basename='Message')
+    router.register(r'inbox', views.InboxViewSet, basename='Inbox')
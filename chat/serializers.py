@@ -0,0 +1,53 @@
+from rest_framework import serializers
+from . import models
+
+class MessageSerializer(serializers.ModelSerializer):
+    sender = serializers.SlugRelatedField(
+        slug_field='uuid',
+        many=False,
+        read_only=True,
+    )
+    receiver = serializers.SlugRelatedField(
+        slug_field='uuid',
+        many=False,
+        read_only=True,
+    )
+
+    class Meta:
+        model = models.Message
+        fields = (
+            'uuid',
+            'sender',
+            'receiver',
+            'content',
+            'viewed',
+            'registration_date',
+        )
+        read_only_fields = (
+            'uuid',
+            'viewed',
+            'registration_date',
+        )
+
+
+class InboxSerializer(serializers.ModelSerializer):
+    job = serializers.SlugRelatedField(
+        slug_field='uuid',
+        many=False,
+        read_only=True,
+    )
+    last_message = MessageSerializer(read_only=True)
+
+    class Meta:
+        model = models.UnreadCounter
+        fields = (
+            'job',
+            'unread',
+            'last_message',
+            'last_message_date',
+        )
+        read_only_fields = fields
+
+
+class ReadSerializer(serializers.Serializer):
+    message = serializers.UUIDField(required=False)
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from financial.models import Payment
+from services.models import Job
+from . import participants, realtime
+from .models import Message, UnreadCounter
+
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: realtime.publish(instance))
+
+
+@receiver(post_save, sender=Message)
+def count_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UnreadCounter.record(instance)
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def forget_job(sender, instance, raw=False, **kwargs):
+    if not raw:
+        participants.forget(instance.uuid)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def forget_payment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        for job_uuid in Job.objects.filter(pk=instance.job_id).values_list('uuid', flat=True):
+            participants.forget(job_uuid)
@@ -1,5 +1,15 @@
-from django.test import TestCase
-from .models import Message, User
+import asyncio
+import json
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test import Client, TestCase, TransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from api.asgi import application
+from api.testing import QueryBudgetMixin
+from django.core.cache import cache
+from . import participants, realtime
+from financial.models import Payment
+from .models import Message, UnreadCounter, User
 from core.models import Professional
 from services.models import Job, Proposal
 from django.utils import timezone
@@ -7,9 +17,15 @@ from django.utils import timezone
 
 TODAY = timezone.now()
 timedelta = timezone.timedelta
-class TestChat(TestCase):
+
+
+class ChatFixtures:
+    """
+    A client and a professional with a job between them.
+    """
 
     def setUp(self):
+        super().setUp()
         self.client = User(
             email='teste4@teste.com',
             full_name='Tom Cruise',
@@ -53,6 +69,9 @@ class TestChat(TestCase):
         )
         self.job.save()
 
+
+class TestChat(ChatFixtures, TestCase):
+
     def test_send_message(self):
         message = Message(
             sender=self.client,
@@ -64,4 +83,246 @@ class TestChat(TestCase):
         self.assertEqual(
             self.client.messages_sent.all()[0],
             self.user.received_messages.all()[0]
-        )
\ No newline at end of file
+        )
+
+
+class TestMessageAPI(ChatFixtures, QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.client
+        User.objects.filter(pk__in=(self.customer.pk, self.user.pk)).update(is_active=True)
+        self.client = Client()
+        self.client.force_login(self.customer)
+        self.url = f'/jobs/{self.job.uuid}/messages.json'
+
+    def seed_messages(self, amount):
+        Message.objects.bulk_create([
+            Message(
+                sender=self.customer,
+                receiver=self.user,
+                content=f'Message {index}',
+                job=self.job,
+            )
+            for index in range(amount)
+        ])
+
+    def test_list_messages(self):
+        self.seed_messages(5)
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual([message['content'] for message in data['results']], ['Message 4', 'Message 3'])
+        self.assertEqual(data['results'][0]['sender'], str(self.customer.uuid))
+        data = self.client.get(data['next']).json()
+        self.assertEqual([message['content'] for message in data['results']], ['Message 2', 'Message 1'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_list_queries(self):
+        self.assertConstantQueries(self.seed_messages, self.url, limit=50)
+
+    def test_outsider(self):
+        self.seed_messages(1)
+        outsider = User.objects.create(email='outsider@teste.com', is_active=True)
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.post(self.url, {'content': 'Hi'}).status_code, 404)
+
+    def test_empty_conversation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_send_message(self):
+        response = self.client.post(self.url, {'content': 'Hi'})
+        self.assertEqual(response.status_code, 400)
+        Payment.objects.create(
+            client=self.customer,
+            professional=self.professional,
+            value=300,
+            job=self.job,
+            paid=True,
+        )
+        response = self.client.post(self.url, {'content': 'Hi'})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['receiver'], str(self.user.uuid))
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, {'content': 'Hello'})
+        self.assertEqual(response.json()['receiver'], str(self.customer.uuid))
+
+    def test_send_queries(self):
+        payment = Payment.objects.create(
+            client=self.customer,
+            professional=self.professional,
+            value=300,
+            job=self.job,
+            paid=True,
+        )
+        self.client.post(self.url, {'content': 'Hi'})
+        # Session, user, then the insert and the unread counters in a savepoint.
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, {'content': 'Are you there?'})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['receiver'], str(self.user.uuid))
+        payment.paid = False
+        payment.save()
+        self.assertEqual(self.client.post(self.url, {'content': 'Hello?'}).status_code, 400)
+
+    def send(self, sender, receiver, content):
+        return Message.objects.create(sender=sender, receiver=receiver, content=content, job=self.job)
+
+    def test_unread_counters(self):
+        self.send(self.customer, self.user, 'Hi')
+        last = self.send(self.customer, self.user, 'Are you there?')
+        counters = dict(UnreadCounter.objects.filter(job=self.job).values_list('user', 'unread'))
+        self.assertEqual(counters, {self.user.pk: 2, self.customer.pk: 0})
+        self.client.force_login(self.user)
+        data = self.client.get('/inbox.json').json()
+        self.assertEqual(len(data['results']), 1)
+        conversation = data['results'][0]
+        self.assertEqual((conversation['job'], conversation['unread']), (str(self.job.uuid), 2))
+        self.assertEqual(conversation['last_message']['uuid'], str(last.uuid))
+        response = self.client.post(f'/jobs/{self.job.uuid}/messages/read.json')
+        self.assertEqual(response.json(), {'unread': 0})
+        self.assertFalse(Message.objects.filter(job=self.job, viewed=False).exists())
+        self.assertEqual(self.client.get('/inbox.json').json()['results'][0]['unread'], 0)
+        reply = self.send(self.user, self.customer, 'Yes')
+        self.client.force_login(self.customer)
+        conversation = self.client.get('/inbox.json').json()['results'][0]
+        self.assertEqual((conversation['unread'], conversation['last_message']['uuid']), (1, str(reply.uuid)))
+
+    def test_last_message_follows_date(self):
+        first = self.send(self.customer, self.user, 'First')
+        second = self.send(self.customer, self.user, 'Second')
+        # A concurrent send can insert the higher id with the earlier date.
+        Message.objects.filter(pk=second.pk).update(registration_date=first.registration_date - timedelta(seconds=1))
+        second.refresh_from_db()
+        UnreadCounter.objects.filter(job=self.job).delete()
+        UnreadCounter.record(first)
+        UnreadCounter.record(second)
+        counter = UnreadCounter.objects.get(job=self.job, user=self.user)
+        self.assertEqual((counter.last_message_id, counter.last_message_date), (first.pk, first.registration_date))
+        self.assertEqual(counter.unread, 2)
+
+    def test_read_up_to(self):
+        messages = [self.send(self.customer, self.user, f'Message {index}') for index in range(5)]
+        self.send(self.user, self.customer, 'Reply')
+        self.client.force_login(self.user)
+        url = f'/jobs/{self.job.uuid}/messages/read.json'
+        with self.assertNumQueries(9):
+            response = self.client.post(url, {'message': str(messages[2].uuid)})
+        self.assertEqual(response.json(), {'unread': 2})
+        viewed = Message.objects.filter(job=self.job, receiver=self.user, viewed=True)
+        self.assertEqual(set(viewed.values_list('pk', flat=True)), {message.pk for message in messages[:3]})
+        response = self.client.post(url, {'message': str(messages[1].uuid)})
+        self.assertEqual(response.json(), {'unread': 2})
+        self.assertEqual(self.client.post(url, {'message': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'message': str(self.job.uuid)}).status_code, 404)
+        self.assertEqual(self.client.post(url).json(), {'unread': 0})
+        self.assertTrue(Message.objects.get(content='Reply', job=self.job).viewed is False)
+
+    def test_inbox_queries(self):
+        self.send(self.customer, self.user, 'Hi')
+        queries = self.count_queries('/inbox.json')
+        for index in range(20):
+            self.send(self.user, self.customer, f'Reply {index}')
+        self.assertEqual(self.count_queries('/inbox.json'), queries)
+
+
+class TestRealtime(ChatFixtures, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.client
+        User.objects.filter(pk__in=(self.customer.pk, self.user.pk)).update(is_active=True)
+        self.addCleanup(self.stop_listener)
+
+    def stop_listener(self):
+        listener = realtime.hub.listener
+        if listener is not None:
+            listener.stop()
+            listener.join(5)
+            realtime.hub.listener = None
+
+    def connect(self, user, job=None):
+        return ApplicationCommunicator(application, {
+            'type': 'websocket',
+            'path': f'/ws/jobs/{job or self.job.uuid}/messages/',
+            'query_string': f'token={AccessToken.for_user(user)}'.encode(),
+            'headers': [],
+        })
+
+    def test_delivery(self):
+        async def run():
+            communicator = self.connect(self.customer)
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output(5))['type'], 'websocket.accept')
+            await asyncio.get_running_loop().run_in_executor(None, realtime.hub.listener.ready.wait, 5)
+            await sync_to_async(Message.objects.create)(
+                sender=self.user,
+                receiver=self.customer,
+                content='Hello! How are you?',
+                job=self.job,
+            )
+            event = await communicator.receive_output(5)
+            message = json.loads(event['text'])
+            self.assertEqual((message['content'], message['sender']), ('Hello! How are you?', str(self.user.uuid)))
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(1)
+            self.assertEqual(realtime.hub.subscribers, {})
+        async_to_sync(run)()
+
+    def test_outsider_is_rejected(self):
+        outsider = User.objects.create(email='outsider@teste.com', is_active=True)
+
+        async def run():
+            for communicator in (self.connect(outsider), self.connect(self.customer, job='not-a-job')):
+                await communicator.send_input({'type': 'websocket.connect'})
+                self.assertEqual(await communicator.receive_output(5), {'type': 'websocket.close', 'code': 4403})
+        async_to_sync(run)()
+
+    def test_inactive_user_is_rejected(self):
+        User.objects.filter(pk=self.customer.pk).update(is_active=False)
+
+        async def run():
+            communicator = self.connect(self.customer)
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual(await communicator.receive_output(5), {'type': 'websocket.close', 'code': 4403})
+        async_to_sync(run)()
+
+    def test_slow_consumer(self):
+        async def run():
+            subscriber = realtime.hub.subscribe(str(self.job.uuid), size=2)
+            for index in range(3):
+                realtime.hub.publish(str(self.job.uuid), {'content': index})
+            self.assertIs(subscriber.queue.get_nowait(), realtime.OVERFLOW)
+            self.assertTrue(subscriber.queue.empty())
+            realtime.hub.unsubscribe(subscriber)
+        async_to_sync(run)()
+
+
+class TestStaleSnapshot(ChatFixtures, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.client
+        User.objects.filter(pk=self.customer.pk).update(is_active=True)
+        self.client = Client()
+        self.client.force_login(self.customer)
+        Payment.objects.create(
+            client=self.customer,
+            professional=self.professional,
+            value=300,
+            job=self.job,
+            paid=True,
+        )
+
+    def test_deleted_job(self):
+        key = participants.cache_key(self.job.uuid)
+        snapshot = participants.get_job(self.job.uuid)
+        Job.objects.filter(pk=self.job.pk).delete()
+        # Another worker still has the job cached.
+        cache.set(key, snapshot)
+        response = self.client.post(f'/jobs/{self.job.uuid}/messages.json', {'content': 'Hi'})
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(cache.get(key))
@@ -1,3 +1,124 @@
-from django.shortcuts import render
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from api.pagination import KeysetPagination
+from services.models import Job
+from . import models, participants, serializers
 
-# Create your views here.
+class MessageViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Messages of a job, newest first. The participant check is part of the
+    query that fetches the page, so a page is one range scan of
+    `chat_message_job_date_idx`.
+    """
+    serializer_class = serializers.MessageSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    lookup_field = 'uuid'
+
+    @property
+    def jobs(self):
+        return Job.objects.filter(
+            Q(client=self.request.user) |
+            Q(professional__user=self.request.user),
+            uuid=self.kwargs.get('job_uuid'),
+        )
+
+    def get_queryset(self):
+        return models.Message.objects.filter(
+            Q(job__client=self.request.user) |
+            Q(job__professional__user=self.request.user),
+            job__uuid=self.kwargs.get('job_uuid'),
+        ).select_related('sender', 'receiver').order_by('-registration_date', '-id')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        if not page and not self.jobs.exists():
+            raise Http404
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def create(self, request, *args, **kwargs):
+        job = participants.get_job(self.kwargs.get('job_uuid'))
+        if job is None or request.user not in participants.users(job):
+            raise Http404
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        receiver = job.professional.user if request.user == job.client else job.client
+        message = models.Message(
+            job=job,
+            sender=request.user,
+            receiver=receiver,
+            content=serializer.validated_data['content'],
+        )
+        try:
+            # The job and both users come from the snapshot and the uuid is
+            # new, so the foreign key and unique lookups would only repeat it.
+            message.full_clean(exclude=['job', 'sender', 'receiver'], validate_unique=False)
+        except ValidationError as error:
+            return Response({'error': error.messages}, status=400)
+        try:
+            with transaction.atomic():
+                message.save()
+        except IntegrityError:
+            # The job was deleted after another process cached it.
+            participants.forget(job.uuid)
+            raise Http404
+        serializer.instance = message
+        return Response(serializer.data, status=201)
+
+    @action(methods=['post'], detail=False)
+    def read(self, request, *args, **kwargs):
+        """
+        Marks the messages the user received up to `message` as viewed, or
+        all of them without it, and returns how many are left unread.
+        """
+        job = get_object_or_404(self.jobs)
+        serializer = serializers.ReadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        messages = models.Message.objects.filter(job=job, receiver=request.user, viewed=False)
+        until = serializer.validated_data.get('message')
+        if until is not None:
+            message = models.Message.objects.filter(job=job, uuid=until).values('registration_date', 'id').first()
+            if message is None:
+                return Response({'error': 'Message not found'}, status=404)
+            messages = messages.filter(
+                Q(registration_date__lt=message['registration_date']) |
+                Q(registration_date=message['registration_date'], id__lte=message['id'])
+            )
+        with transaction.atomic():
+            read = messages.update(viewed=True)
+            counters = models.UnreadCounter.objects.filter(job=job, user=request.user)
+            if read:
+                counters.update(unread=Greatest(F('unread') - read, 0))
+            unread = counters.values_list('unread', flat=True).first()
+        return Response({'unread': unread or 0})
+
+
+class InboxViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    The user's conversations, latest first, with their last message and
+    unread count, read from `chat_unread_inbox_idx`.
+    """
+    serializer_class = serializers.InboxSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return models.UnreadCounter.objects.filter(
+            user=self.request.user,
+            last_message_date__isnull=False,
+        ).select_related(
+            'job',
+            'last_message__sender',
+            'last_message__receiver',
+        ).order_by('-last_message_date', '-id')
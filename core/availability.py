@@ -0,0 +1,60 @@
+import calendar
+import datetime
+from django.utils import timezone
+
+WEEK_DAYS = ('MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN')
+
+
+def add_months(date, months):
+    month = date.month - 1 + months
+    year = date.year + month // 12
+    month = month % 12 + 1
+    if date.day > calendar.monthrange(year, month)[1]:
+        return None
+    return date.replace(year=year, month=month)
+
+
+def dates(start, recurrence, weekly_recurrence, until):
+    if not recurrence:
+        yield start
+        return
+    if recurrence == 'M':
+        months = 0
+        while True:
+            date = add_months(start, months)
+            months += 1
+            if date is None:
+                continue
+            if date > until:
+                return
+            yield date
+    week_days = {
+        WEEK_DAYS.index(day.upper()) for day in (weekly_recurrence or [])
+    } or {start.weekday()}
+    date = start
+    while date <= until:
+        if recurrence == 'D' or date.weekday() in week_days:
+            yield date
+        date += datetime.timedelta(days=1)
+
+
+def occurrences(start_datetime, end_datetime, recurrence, weekly_recurrence, since, until):
+    """
+    Yields the (start, end) of every occurrence of an availability that
+    ends after `since` and starts before `until`.
+
+    Recurrences repeat the wall-clock time of the first occurrence in the
+    current time zone: every day (D), on the `weekly_recurrence` days or
+    the weekday of the start (W), or on the same day of the month (M).
+    """
+    start = timezone.localtime(start_datetime)
+    duration = end_datetime - start_datetime
+    until = timezone.localtime(until)
+    for date in dates(start.date(), recurrence, weekly_recurrence, until.date()):
+        occurrence = timezone.make_aware(
+            datetime.datetime.combine(date, start.time().replace(tzinfo=None)),
+        )
+        if occurrence >= until and recurrence:
+            return
+        if occurrence + duration > since:
+            yield occurrence, occurrence + duration
@@ -0,0 +1,62 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'search:version'
+IGNORED_PARAMS = ('format',)
+
+
+def search_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Starting from the clock keeps an evicted version from coming back
+        # and serving the entries written under it.
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_search_version():
+    """
+    Moves the search results to a new namespace, once now and once more
+    when the transaction commits, so a read between the write and the
+    commit cannot cache the old rows under the new version.
+    """
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            search_version()
+        else:
+            # incr sets the key again with the default timeout on some
+            # backends, which would expire the version and flush the results.
+            cache.touch(VERSION_KEY, None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def search_key(name, request, ignored=IGNORED_PARAMS):
+    params = sorted(
+        (key, value)
+        for key in request.query_params if key not in ignored
+        for value in request.query_params.getlist(key)
+    )
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.path}?{urlencode(params)}'.encode()
+    ).hexdigest()
+    return f'search:{search_version()}:{name}:{digest}'
+
+
+def cached_search(name, request, compute, timeout, ignored=IGNORED_PARAMS):
+    """
+    Returns the cached result of `compute()` for the normalized query of
+    the request, computing and storing it on a miss.
+    """
+    key = search_key(name, request, ignored)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, timeout)
+    return data
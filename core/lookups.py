@@ -0,0 +1,21 @@
+from django.db.models import CharField, FloatField, Func, TextField, Value
+from django.db.models.lookups import PostgresOperatorLookup
+
+
+@CharField.register_lookup
+@TextField.register_lookup
+class TrigramWordSimilar(PostgresOperatorLookup):
+    """
+    Matches when the value is similar to some word sequence of the column,
+    so a typed prefix finds the full name. Served by gin_trgm_ops indexes.
+    """
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+class WordSimilarity(Func):
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        super().__init__(Value(string), expression, **extra)
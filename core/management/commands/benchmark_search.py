@@ -0,0 +1,121 @@
+import random
+import re
+from itertools import combinations
+from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils.timezone import localdate, now, timedelta
+from rest_framework.request import Request
+from core.models import (
+    Address, Availability, AvailabilitySlot, OCCUPATIONS, Professional, SERVICES, STATES, User,
+)
+from core.views import Professionals
+
+
+CITIES = ('Campinas', 'Santos', 'Belo Horizonte', 'Curitiba', 'Recife', 'Salvador')
+WEEK_DAYS = [day for day, name in Availability.WEEK_DAYS]
+INDEX_SCAN = re.compile(r'Index(?: Only)? Scan(?: Backward)? (?:using|on) (\w+)')
+EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+def get_filters():
+    return {
+        'skills': {'skills': 'HC'},
+        'state': {'state': 'SP'},
+        'city': {'city': 'Campinas'},
+        'occupation': {'occupation': 'EM'},
+        'window': {'start_date': localdate() + timedelta(days=1), 'start_time': '08:00', 'end_time': '12:00'},
+        'search': {'search': 'enfermagem'},
+    }
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN ANALYZE on the professional search for every combination of its filters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Professionals to create before the run')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data')
+        parser.add_argument('--size', type=int, default=len(get_filters()), help='Largest combination of filters')
+
+    def handle(self, *args, seed, keep, size, verbosity, **options):
+        with transaction.atomic():
+            if seed:
+                self.seed(seed)
+                with connection.cursor() as cursor:
+                    for model in (User, Address, Professional, Availability, AvailabilitySlot):
+                        cursor.execute(f'ANALYZE {model._meta.db_table}')
+            filters = get_filters()
+            for length in range(min(size, len(filters)) + 1):
+                for names in combinations(filters, length):
+                    self.explain(filters, names, verbosity)
+            if seed and not keep:
+                transaction.set_rollback(True)
+
+    def explain(self, filters, names, verbosity):
+        params = {}
+        for name in names:
+            params.update(filters[name])
+        view = Professionals()
+        view.request = Request(RequestFactory().get('/professionals/', params))
+        queryset = view.filter_queryset(view.get_queryset())
+        plan = queryset[:view.paginator.get_limit(view.request) + 1].explain(analyze=True)
+        indexes = sorted(set(INDEX_SCAN.findall(plan)))
+        time = EXECUTION_TIME.search(plan)
+        self.stdout.write('{:>10} ms  {:<50} {}'.format(
+            time.group(1) if time else '?',
+            ', '.join(names) or '(none)',
+            ', '.join(indexes) or 'no index',
+        ))
+        if verbosity > 1:
+            self.stdout.write(plan + '\n')
+
+    def seed(self, amount):
+        password = make_password(None)
+        suffix = now().strftime('%Y%m%d%H%M%S')
+        users = User.objects.bulk_create(
+            User(
+                email=f'benchmark{index}.{suffix}@example.com',
+                password=password,
+                full_name=f'Profissional {index}',
+                is_active=random.random() > 0.1,
+            )
+            for index in range(amount)
+        )
+        Address.objects.bulk_create(
+            Address(
+                user=user,
+                street='Rua',
+                street_number='1',
+                zipcode='00000-000',
+                state=random.choice(STATES)[0],
+                city=random.choice(CITIES),
+                complementary='',
+            )
+            for user in users
+        )
+        professionals = Professional.objects.bulk_create(
+            Professional(
+                user=user,
+                occupation=random.choice(OCCUPATIONS)[0],
+                skills=random.sample([service for service, name in SERVICES], 2),
+                avg_price=random.randint(65, 300),
+                coren='10.400',
+            )
+            for user in users
+        )
+        start = now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        availabilities = []
+        for professional in professionals:
+            start_datetime = start + timedelta(hours=random.randint(0, 72))
+            availabilities.append(Availability(
+                professional=professional,
+                start_datetime=start_datetime,
+                end_datetime=start_datetime + timedelta(hours=4),
+                recurrence=random.choice(('D', 'W', 'M', None)),
+                weekly_recurrence=random.sample(WEEK_DAYS, 2),
+            ))
+        for availability in Availability.objects.bulk_create(availabilities):
+            availability.expand()
+        Professional.objects.filter(pk__in=[professional.pk for professional in professionals]).update_search_document()
+        self.stdout.write(f'{amount} professionals seeded')
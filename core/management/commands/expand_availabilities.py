@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils.timezone import now
+from core.cache import bump_search_version
+from core.models import Availability, AvailabilitySlot
+
+
+class Command(BaseCommand):
+    help = 'Drops the past availability slots and extends the recurring ones up to the horizon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Run again every INTERVAL seconds instead of once')
+
+    def handle(self, *args, interval, **options):
+        while True:
+            self.expand()
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def expand(self):
+        with transaction.atomic():
+            deleted, _ = AvailabilitySlot.objects.filter(period__endswith__lte=now()).delete()
+        availabilities = Availability.objects.filter(recurrence__isnull=False).annotate(
+            last_slot=models.Max(models.Func(
+                models.F('slots__period'),
+                function='LOWER',
+                output_field=models.DateTimeField(),
+            )),
+        )
+        created = 0
+        for availability in availabilities.iterator():
+            with transaction.atomic():
+                if availability.last_slot is None:
+                    created += len(availability.expand())
+                else:
+                    created += len(availability.expand(since=availability.last_slot))
+        if deleted or created:
+            bump_search_version()
+        self.stdout.write(f'{deleted} slots removed, {created} slots created')
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def fill_search_document(apps, schema_editor):
+    Professional = apps.get_model('core', 'Professional')
+    document = Professional.objects.filter(
+        pk=models.OuterRef('pk'),
+    ).annotate(
+        document=(
+            SearchVector('user__full_name', weight='A') +
+            SearchVector('occupation', 'skills', 'user__address__city', weight='B') +
+            SearchVector('coren', 'about', 'user__email', weight='C')
+        ),
+    ).values('document')[:1]
+    Professional.objects.update(search_document=models.Subquery(document))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_professional_pagarme_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='professional',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='professional',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='core_profes_search__b72aaa_gin'),
+        ),
+        migrations.RunPython(fill_search_document, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:54
+
+from core.availability import occurrences
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.timezone import now, timedelta
+from psycopg2.extras import DateTimeTZRange
+
+
+def expand_availabilities(apps, schema_editor):
+    Availability = apps.get_model('core', 'Availability')
+    AvailabilitySlot = apps.get_model('core', 'AvailabilitySlot')
+    until = now() + timedelta(days=settings.AVAILABILITY_HORIZON)
+    for availability in Availability.objects.iterator():
+        AvailabilitySlot.objects.bulk_create(
+            AvailabilitySlot(
+                availability=availability,
+                professional_id=availability.professional_id,
+                period=DateTimeTZRange(start, end),
+            )
+            for start, end in occurrences(
+                availability.start_datetime,
+                availability.end_datetime,
+                availability.recurrence,
+                availability.weekly_recurrence,
+                now(),
+                until,
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_professional_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilitySlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', django.contrib.postgres.fields.ranges.DateTimeRangeField()),
+                ('availability', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='core.availability')),
+                ('professional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='core.professional')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='availabilityslot',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['period'], name='core_availa_period_f47ce8_gist'),
+        ),
+        migrations.RunPython(expand_availabilities, migrations.RunPython.noop),
+    ]
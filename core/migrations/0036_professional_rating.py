@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:57
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_ratings(apps, schema_editor):
+    Professional = apps.get_model('core', 'Professional')
+    Rating = apps.get_model('services', 'Rating')
+    ratings = Rating.objects.filter(
+        job__professional=models.OuterRef('pk'),
+    ).order_by().values('job__professional')
+    Professional.objects.update(
+        rating_sum=Coalesce(models.Subquery(ratings.annotate(total=models.Sum('grade')).values('total')), 0),
+        rating_count=Coalesce(models.Subquery(ratings.annotate(total=models.Count('pk')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_availabilityslot'),
+        ('services', '0015_auto_20201206_1425'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='professional',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='professional',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:03
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_professional_rating'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='address',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['city'], name='core_address_city_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['full_name'], name='core_user_full_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:09
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['state', 'city'], name='core_address_state_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='availability',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['weekly_recurrence'], name='core_avail_weekly_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(condition=models.Q(recurrence__isnull=False), fields=['recurrence'], name='core_avail_recurring_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='professional',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['skills'], name='core_prof_skills_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='professional',
+            index=models.Index(fields=['occupation'], name='core_prof_occupation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(is_active=True), fields=['id'], name='core_user_active_idx'),
+        ),
+    ]
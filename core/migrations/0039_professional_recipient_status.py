@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='professional',
+            name='recipient_status',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+    ]
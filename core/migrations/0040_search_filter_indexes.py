@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_professional_recipient_status'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='address',
+            name='core_address_state_city_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='core_user_active_idx',
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['state'], name='core_address_state_idx'),
+        ),
+    ]
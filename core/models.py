@@ -1,19 +1,24 @@
 import uuid
 from django.db import models
+from django.db.models.functions import Abs, Cast, Coalesce, Greatest, Least, NullIf
 from django.contrib.auth.models import AbstractUser, UserManager as UM
 from django.core.validators import validate_email, RegexValidator, MinValueValidator
 from django.core.exceptions import ValidationError
 from django.utils.deconstruct import deconstructible
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, DateTimeRangeField
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField
 from functools import reduce
-from pagarme import customer, recipient
 from django.template.loader import render_to_string
 import re
 from django.contrib.auth.tokens import PasswordResetTokenGenerator, default_token_generator as dtg
 from django.conf import settings
-from django.utils.timezone import now
-import pagarme
-from pagarme.resources import handler_request
+from django.utils.timezone import now, timedelta
+from psycopg2.extras import DateTimeTZRange
+from .availability import occurrences
+from .lookups import WordSimilarity
+from itertools import chain
+from financial import cache as pagarme_cache, gateway
 
 
 class TokenGenerator(PasswordResetTokenGenerator):
@@ -224,8 +229,6 @@ class User(AbstractUser):
     USERNAME_FIELD='email'
     REQUIRED_FIELDS=['password']
 
-    __customer = None
-    __cards = []
 
     @property
     def is_professional(self):
@@ -237,17 +240,15 @@ class User(AbstractUser):
     
     @property
     def customer(self):
-        if self.saved_in_pagarme and self.__customer == None:
-            self.__customer = handler_request.get(f'https://api.pagar.me/1/customers/{self.pagarme_id}', {})
-        return self.__customer
+        if self.saved_in_pagarme:
+            return pagarme_cache.lookup('customer', self.pagarme_id)
+        return None
 
     @property
     def cards(self):
-        if not self.__cards and self.saved_in_pagarme:
-            self.__cards = handler_request.get(
-                f'https://api.pagar.me/1/cards?customer_id={self.pagarme_id}'
-            )
-        return self.__cards
+        if self.saved_in_pagarme:
+            return pagarme_cache.lookup('cards', self.pagarme_id)
+        return []
 
     @property
     def full_cellphone(self):
@@ -326,18 +327,22 @@ class User(AbstractUser):
                 data['phone_numbers'].append(self.full_cellphone)
             if self.full_telephone:
                 data['phone_numbers'].append(self.full_telephone)
-            self.__customer = customer.create(data)
-            if 'id' in self.__customer:
+            customer = gateway.create_customer(data)
+            if 'id' in customer:
                 self.saved_in_pagarme = True
-                self.pagarme_id = self.__customer['id']
+                self.pagarme_id = customer['id']
                 self.save(update_fields=['saved_in_pagarme', 'pagarme_id'])
+                pagarme_cache.invalidate('customer', self.pagarme_id)
+            return customer
         return self.customer
 
     def create_card(self, card):
-        return pagarme.card.create({
+        card = gateway.create_card({
             **card,
             'customer_id': self.pagarme_id,
         })
+        pagarme_cache.invalidate('cards', self.pagarme_id)
+        return card
 
     def validate_customer(self):
         if not self.saved_in_pagarme or not self.pagarme_id:
@@ -350,6 +355,9 @@ class User(AbstractUser):
 
     class Meta(AbstractUser.Meta):
         swappable='AUTH_USER_MODEL'
+        indexes = [
+            GinIndex(fields=['full_name'], name='core_user_full_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
 
 class Address(models.Model):
@@ -389,6 +397,12 @@ class Address(models.Model):
     def __str__(self) -> str:
         return f'{self.street}, {self.street_number}, {self.neighborhood}, {self.city} - {self.state}'
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['city'], name='core_address_city_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['state'], name='core_address_state_idx'),
+        ]
+
 class Availability(models.Model):
     RECURRENCES = (
         ('D', 'Daily'),
@@ -450,7 +464,200 @@ class Availability(models.Model):
         self.validate_start()
         return super(Availability, self).full_clean(*args, **kwargs)
 
+    def expand(self, since=None):
+        """
+        Materializes the occurrences up to the availability horizon. Without
+        `since` the slots are rebuilt, otherwise only the occurrences that
+        start after it are appended.
+        """
+        until = now() + timedelta(days=settings.AVAILABILITY_HORIZON)
+        if since is None:
+            self.slots.all().delete()
+        slots = [
+            AvailabilitySlot(
+                availability=self,
+                professional_id=self.professional_id,
+                period=DateTimeTZRange(start, end),
+            )
+            for start, end in occurrences(
+                self.start_datetime,
+                self.end_datetime,
+                self.recurrence,
+                self.weekly_recurrence,
+                since or now(),
+                until,
+            )
+            if since is None or start > since
+        ]
+        return AvailabilitySlot.objects.bulk_create(slots)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['weekly_recurrence'], name='core_avail_weekly_gin'),
+            models.Index(
+                fields=['recurrence'],
+                name='core_avail_recurring_idx',
+                condition=models.Q(recurrence__isnull=False),
+            ),
+        ]
+
+
+class AvailabilitySlot(models.Model):
+    availability = models.ForeignKey(
+        Availability,
+        on_delete=models.CASCADE,
+        related_name='slots',
+    )
+    professional = models.ForeignKey(
+        'Professional',
+        on_delete=models.CASCADE,
+        related_name='slots',
+    )
+    period = DateTimeRangeField()
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=['period']),
+        ]
+
+SEARCH_DOCUMENT = (
+    SearchVector('user__full_name', weight='A') +
+    SearchVector('occupation', 'skills', 'user__address__city', weight='B') +
+    SearchVector('coren', 'about', 'user__email', weight='C')
+)
+
+
+RELEVANCE_WEIGHTS = (
+    ('rank', 1.0),
+    ('rating_score', 0.3),
+    ('price_fit', 0.2),
+    ('coverage', 0.3),
+)
+
+
+def as_float(expression):
+    return models.ExpressionWrapper(expression, output_field=models.FloatField())
+
+
+class ProfessionalQuerySet(models.QuerySet):
+
+    def update_search_document(self):
+        document = Professional.objects.filter(
+            pk=models.OuterRef('pk'),
+        ).annotate(document=SEARCH_DOCUMENT).values('document')[:1]
+        return self.update(search_document=models.Subquery(document))
+
+    def available(self, start, end):
+        return self.filter(models.Exists(AvailabilitySlot.objects.filter(
+            professional=models.OuterRef('pk'),
+            period__overlap=DateTimeTZRange(start, end),
+        )))
+
+    def with_rating(self):
+        return self.annotate(rating=Coalesce(
+            as_float(Cast(models.F('rating_sum'), models.FloatField()) / NullIf(models.F('rating_count'), 0)),
+            0.0,
+        ))
+
+    def with_price(self):
+        return self.annotate(price=Coalesce(models.F('avg_price'), 0.0))
+
+    def with_price_fit(self, budget):
+        """
+        Annotates how close the average price is to the budget, from 1 on
+        the budget to 0 at twice or none of it.
+        """
+        distance = as_float(Abs(models.F('avg_price') - budget) / budget)
+        return self.annotate(price_fit=models.Case(
+            models.When(avg_price__gt=0, then=Greatest(1.0 - distance, 0.0)),
+            default=0.0,
+            output_field=models.FloatField(),
+        ))
+
+    def with_coverage(self, start, end):
+        """
+        Annotates the fraction of the window covered by the availability
+        slots of each professional.
+        """
+        period = lambda function: models.Func(
+            models.F('period'), function=function, output_field=models.DateTimeField(),
+        )
+        covered = models.Func(
+            Least(period('UPPER'), models.Value(end, models.DateTimeField())) -
+            Greatest(period('LOWER'), models.Value(start, models.DateTimeField())),
+            template='EXTRACT(EPOCH FROM %(expressions)s)',
+            output_field=models.FloatField(),
+        )
+        slots = AvailabilitySlot.objects.filter(
+            professional=models.OuterRef('pk'),
+            period__overlap=DateTimeTZRange(start, end),
+        ).order_by().values('professional').annotate(covered=models.Sum(covered)).values('covered')
+        window = max((end - start).total_seconds(), 1)
+        return self.annotate(coverage=Coalesce(
+            Least(as_float(models.Subquery(slots, output_field=models.FloatField()) / window), 1.0),
+            0.0,
+        ))
+
+    def with_relevance(self):
+        """
+        Annotates the weighted sum of the text rank, the rating, the price
+        fit and the availability coverage that were annotated before.
+        """
+        queryset = self.annotate(rating_score=as_float(
+            Cast(models.F('rating_sum'), models.FloatField()) / (5 * (models.F('rating_count') + 3))
+        ))
+        return queryset.annotate(relevance=as_float(sum(
+            models.F(name) * weight
+            for name, weight in RELEVANCE_WEIGHTS
+            if name in queryset.query.annotations
+        )))
+
+    def facets(self, cities=20):
+        """
+        Counts the professionals per occupation, skill, state and the
+        `cities` most common cities.
+        """
+        def count(field, *ordering):
+            return self.order_by().filter(**{f'{field}__isnull': False}).values_list(field).annotate(
+                count=models.Count('pk'),
+            ).order_by(*ordering or (field,))
+
+        return {
+            'occupation': dict(count('occupation')),
+            'skills': self.order_by().aggregate(**{
+                skill: models.Count('pk', filter=models.Q(skills__contains=[skill]))
+                for skill, _ in SERVICES
+            }),
+            'state': dict(count('user__address__state')),
+            'city': dict(count('user__address__city', '-count', 'user__address__city')[:cities]),
+        }
+
+    def autocomplete(self, text, limit=10):
+        """
+        Returns the `limit` professionals whose name or city best match the
+        typed text. Each field is looked up through its own trigram index.
+        """
+        fields = ('uuid', 'user__full_name', 'user__address__city', 'occupation', 'similarity')
+        matches = [
+            self.filter(**{f'{field}__trigram_word_similar': text}).annotate(
+                similarity=WordSimilarity(text, field),
+            ).values(*fields).order_by('-similarity', 'pk')[:limit]
+            for field in ('user__full_name', 'user__address__city')
+        ]
+        results = {}
+        for match in sorted(chain(*matches), key=lambda item: -item['similarity']):
+            results.setdefault(match['uuid'], match)
+        return list(results.values())[:limit]
+
+    def search(self, text):
+        query = SearchQuery(text)
+        return self.filter(search_document=query).annotate(
+            rank=Cast(SearchRank(models.F('search_document'), query), models.FloatField()),
+        )
+
+
 class Professional(models.Model):
+    objects = ProfessionalQuerySet.as_manager()
     uuid = models.UUIDField(
         unique=True,
         editable=False,
@@ -501,15 +708,45 @@ class Professional(models.Model):
         blank=True,
         max_length=100,
     )
-    __recipient = {}
+    search_document = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+    rating_sum = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    recipient_status = models.CharField(
+        max_length=20,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    # Kept up to date with queryset updates, by the rating and search
+    # signals and the postbacks, so a save never writes them back.
+    DATABASE_FIELDS = ('search_document', 'rating_sum', 'rating_count', 'recipient_status')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DATABASE_FIELDS
+                and field.attname not in deferred
+            ]
+        return super().save(*args, **kwargs)
 
     @property
     def recipient(self):
-        if self.saved_in_pagarme and not self.__recipient:
-            self.__recipient = handler_request.get(
-                f'https://api.pagar.me/1/recipients/{self.pagarme_id}'
-            )
-        return self.__recipient
+        if self.saved_in_pagarme:
+            return pagarme_cache.lookup('recipient', self.pagarme_id)
+        return {}
     
     @property
     def postback_url(self):
@@ -517,7 +754,9 @@ class Professional(models.Model):
 
     @property
     def avg_rating(self):
-        return self.jobs.filter(rate__isnull=False).all().aggregate(models.Avg('rate__grade'))['rate__grade__avg']
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
+        return None
 
     @property
     def cash(self):
@@ -528,7 +767,7 @@ class Professional(models.Model):
 
     def create_recipient(self, agency, agency_dv, bank_code, account, account_dv, legal_name):
         if not self.saved_in_pagarme:
-            self.__recipient = recipient.create({
+            recipient = gateway.create_recipient({
                 "type": "individual",
                 "name": self.user.full_name,
                 "email": self.user.email,
@@ -557,12 +796,21 @@ class Professional(models.Model):
                     }
                 ]
             })
-            if self.__recipient.get('id') is not None:
+            if recipient.get('id') is not None:
                 self.saved_in_pagarme = True
-                self.pagarme_id = self.__recipient['id']
+                self.pagarme_id = recipient['id']
                 self.save(update_fields=['saved_in_pagarme', 'pagarme_id'])
+                pagarme_cache.invalidate('recipient', self.pagarme_id)
+            return recipient
         return self.recipient
     
     @staticmethod
     def get_deleted_professional(cls):
-        return cls.objects.get(user__email='deleted@user.com')
\ No newline at end of file
+        return cls.objects.get(user__email='deleted@user.com')
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_document']),
+            GinIndex(fields=['skills'], name='core_prof_skills_gin'),
+            models.Index(fields=['occupation'], name='core_prof_occupation_idx'),
+        ]
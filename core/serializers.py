@@ -2,8 +2,51 @@ from django.core.validators import RegexValidator
 from core.forms import ERROR_MESSAGES
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
+import requests
+from financial.gateway import GatewayError
 from . import models
 
+
+EXPANDABLE_FIELDS = ('customer', 'recipient', 'cash')
+
+
+def get_expand(request):
+    """
+    Parses `?expand=customer,recipient,cash`, the profile fields that cost
+    a gateway call or an aggregate and are left out unless requested.
+    """
+    params = getattr(request, 'query_params', request.GET)
+    expand = {name.strip() for name in params.get('expand', '').split(',') if name.strip()}
+    unknown = expand.difference(EXPANDABLE_FIELDS)
+    if unknown:
+        raise serializers.ValidationError({'expand': f'Unknown fields: {", ".join(sorted(unknown))}'})
+    return expand
+
+
+class GatewayField(serializers.JSONField):
+    """
+    Read-only copy of a Pagar.me object. It is left empty when the gateway
+    fails and there is no cached copy, instead of failing the response.
+    Values looked up beforehand are taken from the `gateway` context.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(read_only=True, **kwargs)
+
+    def get_attribute(self, instance):
+        try:
+            value = self.context.get('gateway', {})[self.field_name]
+        except KeyError:
+            try:
+                value = super().get_attribute(instance)
+            except (GatewayError, requests.RequestException):
+                return None
+        if isinstance(value, (GatewayError, requests.RequestException)):
+            return None
+        if isinstance(value, Exception):
+            raise value
+        return value
+
 class AvailabilitiesSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
@@ -123,7 +166,7 @@ class PublicProfessionalSerializer(serializers.HyperlinkedModelSerializer):
 class PrivateProfessionalSerializer(serializers.ModelSerializer):
     cash = serializers.FloatField(read_only=True)
     avg_rating = serializers.IntegerField(read_only=True)
-    recipient = serializers.JSONField(read_only=True)
+    recipient = GatewayField()
 
     class Meta:
         model = models.Professional
@@ -151,13 +194,23 @@ class PrivateProfessionalSerializer(serializers.ModelSerializer):
 class PrivateUserSerializer(serializers.ModelSerializer):
     professional = PrivateProfessionalSerializer(many=False, read_only=False)
     is_professional = serializers.BooleanField(read_only=True)    
-    costumer = serializers.JSONField(read_only=True)
+    customer = GatewayField()
     address = AddressSerializer(required=False)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if not self.context['request'].user.is_professional:
+        request = self.context['request']
+        expand = self.context.get('expand')
+        if expand is None:
+            expand = get_expand(request)
+        if not request.user.is_professional:
             self.fields.pop('professional')
+        else:
+            for name in ('recipient', 'cash'):
+                if name not in expand:
+                    self.fields['professional'].fields.pop(name)
+        if 'customer' not in expand:
+            self.fields.pop('customer')
 
     def update(self, instance, validated_data):
         address = AddressSerializer(data=validated_data.pop('address', None))
@@ -197,12 +250,10 @@ class PrivateUserSerializer(serializers.ModelSerializer):
             'is_professional',
             'customer',
             'professional',
-            'costumer',
         )
         read_only_fields = (
             'is_active',
             'is_professional',
-            'costumer',
             'uuid',
             'saved_in_pagarme',
         )
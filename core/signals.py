@@ -0,0 +1,66 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import models
+from .cache import bump_search_version
+
+USER_SEARCH_FIELDS = {'full_name', 'email'}
+ADDRESS_SEARCH_FIELDS = {'city'}
+PROFESSIONAL_SEARCH_FIELDS = {'occupation', 'skills', 'coren', 'about'}
+USER_PUBLIC_FIELDS = USER_SEARCH_FIELDS | {'avatar', 'is_active'}
+PROFESSIONAL_PUBLIC_FIELDS = PROFESSIONAL_SEARCH_FIELDS | {'avg_price'}
+ADDRESS_PUBLIC_FIELDS = ADDRESS_SEARCH_FIELDS | {'state'}
+
+
+def touches(update_fields, fields):
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+@receiver(post_save, sender=models.Professional)
+def professional_saved(sender, instance, update_fields=None, **kwargs):
+    if touches(update_fields, PROFESSIONAL_SEARCH_FIELDS):
+        models.Professional.objects.filter(pk=instance.pk).update_search_document()
+
+
+@receiver(post_save, sender=models.User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if touches(update_fields, USER_SEARCH_FIELDS):
+        models.Professional.objects.filter(user_id=instance.pk).update_search_document()
+
+
+@receiver(post_save, sender=models.Address)
+@receiver(post_delete, sender=models.Address)
+def address_changed(sender, instance, update_fields=None, **kwargs):
+    if touches(update_fields, ADDRESS_SEARCH_FIELDS):
+        models.Professional.objects.filter(user_id=instance.user_id).update_search_document()
+
+
+@receiver(post_save, sender=models.Availability)
+def availability_saved(sender, instance, **kwargs):
+    instance.expand()
+
+
+@receiver(post_save, sender=models.Availability)
+@receiver(post_delete, sender=models.Availability)
+def search_changed(sender, **kwargs):
+    bump_search_version()
+
+
+@receiver(post_save, sender=models.Professional)
+@receiver(post_delete, sender=models.Professional)
+def professional_changed(sender, update_fields=None, **kwargs):
+    if touches(update_fields, PROFESSIONAL_PUBLIC_FIELDS):
+        bump_search_version()
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if touches(update_fields, USER_PUBLIC_FIELDS) and instance.is_professional:
+        bump_search_version()
+
+
+@receiver(post_save, sender=models.Address)
+@receiver(post_delete, sender=models.Address)
+def address_public_changed(sender, update_fields=None, **kwargs):
+    if touches(update_fields, ADDRESS_PUBLIC_FIELDS):
+        bump_search_version()
@@ -1,14 +1,26 @@
-from financial.models import CashOut
+from financial.models import CashOut, GatewayTransfer
 from services.models import Job, Proposal
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.forms.models import model_to_dict
 from django.http.request import HttpRequest
 from django.test import TestCase, Client
+from django.test.utils import override_settings
 from rest_framework import response
-from .models import Address, Availability, User, Professional, account_activation_token
+from .models import Address, Availability, AvailabilitySlot, User, Professional, account_activation_token
+from .availability import occurrences
+from django.core.management import call_command
+from django.core.cache import cache
+from .cache import VERSION_KEY, bump_search_version, search_version
+from io import StringIO
+import base64
+import datetime
+import json
+import pickle
+import tempfile
 from django.utils.timezone import now, timedelta
 from rest_framework.test import APIClient
+from api.testing import QueryBudgetMixin
 from mock import patch
 
 TODAY = now()
@@ -153,7 +165,9 @@ class ProfessionalTestREST(TestCase):
     def test_list_professionals(self):
         response = client.get('/professionals.json')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), [{
+        self.assertEqual(response.json()['next'], None)
+        self.assertEqual(response.json()['previous'], None)
+        self.assertEqual(response.json()['results'], [{
             'uuid': str(self.professional.uuid),
             'about': self.professional.about,
             'full_name': self.professional.user.full_name,
@@ -169,6 +183,196 @@ class ProfessionalTestREST(TestCase):
             'url': f'http://testserver/professionals/{str(self.professional.uuid)}/'
         }])
 
+    def test_search_professionals(self):
+        response = client.get('/professionals.json', {'search': 'Lagosta'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['uuid'], str(self.professional.uuid))
+        response = client.get('/professionals.json', {'search': 'Pindamonhangaba'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_paginate_professionals(self):
+        for index in range(4):
+            Professional.objects.create(
+                user=User.objects.create_user(
+                    email=f'page{index}@tstd.com',
+                    password='abda1234',
+                    is_active=True,
+                    full_name=f'Bernardo Lagosta {index}',
+                ),
+                skills=['CI'],
+                occupation='CI',
+                coren='10.400'
+            )
+        response = client.get('/professionals.json', {'limit': 2})
+        first = response.json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(first['previous'], None)
+        second = client.get(first['next']).json()
+        third = client.get(second['next']).json()
+        self.assertEqual(len(third['results']), 1)
+        self.assertEqual(third['next'], None)
+        pages = first['results'] + second['results'] + third['results']
+        self.assertEqual(len({item['uuid'] for item in pages}), 5)
+        self.assertEqual(client.get(third['previous']).json()['results'], second['results'])
+        self.assertEqual(client.get(second['previous']).json()['results'], first['results'])
+        ranked = client.get('/professionals.json', {'search': 'Lagosta', 'limit': 3}).json()
+        ranked_next = client.get(ranked['next']).json()
+        pages = ranked['results'] + ranked_next['results']
+        self.assertEqual(len({item['uuid'] for item in pages}), 5)
+        response = client.get('/professionals.json', {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+        for position in ([{}, 1], ['x', 1], [1, 'x'], [None, 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position, 'r': 0}).encode()).decode()
+            response = client.get('/professionals.json', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_filter_professionals(self):
+        uuid = str(self.professional.uuid)
+        for params, expected in (
+            ({'city': 'Longa vida', 'state': 'MG'}, [uuid]),
+            ({'skills': ['HC', 'AE']}, [uuid]),
+            ({'occupation': 'EM'}, []),
+            ({'state': 'SP'}, []),
+        ):
+            response = client.get('/professionals.json', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([item['uuid'] for item in response.json()['results']], expected)
+
+    def test_benchmark_command(self):
+        out, count = StringIO(), Professional.objects.count()
+        call_command('benchmark_search', seed=20, size=1, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], '20 professionals seeded')
+        self.assertEqual(len(lines), 8)
+        self.assertEqual(Professional.objects.count(), count)
+
+    def test_order_professionals(self):
+        cheap = Professional.objects.create(
+            user=User.objects.create_user(
+                email='cheap@tstd.com',
+                password='abda1234',
+                is_active=True,
+                full_name='Carla Lagosta',
+            ),
+            avg_price=40,
+            skills=['CI'],
+            occupation='CI',
+            coren='10.400'
+        )
+        order = lambda **params: [
+            item['uuid'] for item in client.get('/professionals.json', params).json()['results']
+        ]
+        uuids = [str(cheap.uuid), str(self.professional.uuid)]
+        self.assertEqual(order(ordering='price'), uuids)
+        self.assertEqual(order(budget=100), uuids[::-1])
+        self.assertEqual(order(budget=40), uuids)
+        ranked = client.get('/professionals.json', {'budget': 100, 'limit': 1}).json()
+        self.assertEqual(client.get(ranked['next']).json()['results'][0]['uuid'], uuids[0])
+        Professional.objects.filter(pk=cheap.pk).update(rating_sum=50, rating_count=10)
+        cache.clear()
+        self.assertEqual(order(ordering='rating'), uuids)
+        self.assertEqual(order(search='Lagosta'), uuids)
+        self.assertEqual(order(search='Lagosta', ordering='price', budget=200), uuids)
+        for params in ({'ordering': 'name'}, {'budget': 'free'}, {'budget': -1}, {'budget': 'nan'}, {'budget': 'inf'}):
+            response = client.get('/professionals.json', params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_search_cache(self):
+        url = f'/professionals/{self.professional.uuid}.json'
+        prices = lambda: (
+            client.get('/professionals.json', {'state': 'MG'}).json()['results'][0]['avg_price'],
+            client.get(url).json()['avg_price'],
+        )
+        self.assertEqual(prices(), (99, 99))
+        Professional.objects.filter(pk=self.professional.pk).update(avg_price=120)
+        self.assertEqual(prices(), (99, 99))
+        client.login(email='test@tstd.com', password='abda1234')
+        self.assertEqual(prices(), (99, 99))
+        self.professional.user.address.city = 'Ouro Preto'
+        self.professional.user.address.save()
+        self.assertEqual(prices(), (120, 120))
+        response = client.get('/professionals/00000000-0000-0000-0000-000000000000.json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_version(self):
+        version = search_version()
+        User.objects.create_user(email='client@tstd.com', password='abda1234', full_name='Cliente')
+        self.professional.pagarme_id = 're_1'
+        self.professional.save(update_fields=['pagarme_id'])
+        self.assertEqual(search_version(), version)
+        self.professional.avg_price = 150
+        self.professional.save(update_fields=['avg_price'])
+        self.assertNotEqual(search_version(), version)
+
+    def test_search_version_never_expires(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with override_settings(CACHES={'default': backend}):
+                search_version()
+                bump_search_version()
+                # The file backend stores the expiry first, None for never.
+                with open(cache._key_to_file(VERSION_KEY), 'rb') as entry:
+                    self.assertIsNone(pickle.load(entry))
+
+    def test_autocomplete(self):
+        response = client.get('/professionals/autocomplete.json', {'q': 'Bern'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{
+            'uuid': str(self.professional.uuid),
+            'full_name': 'Bernardo Lagosta',
+            'city': 'Longa vida',
+            'occupation': 'CI',
+        }])
+        response = client.get('/professionals/autocomplete.json', {'q': 'longa'})
+        self.assertEqual(len(response.json()), 1)
+        response = client.get('/professionals/autocomplete.json', {'q': 'lagsota'})
+        self.assertEqual(len(response.json()), 0)
+        response = client.get('/professionals/autocomplete.json', {'q': 'Lagoste'})
+        self.assertEqual(len(response.json()), 1)
+
+    def test_facets(self):
+        cache.clear()
+        professional = Professional.objects.create(
+            user=User.objects.create_user(
+                email='facets@tstd.com',
+                password='abda1234',
+                is_active=True,
+                full_name='Pindamonhangaba Silva',
+            ),
+            skills=['AC', 'HC'],
+            occupation='EM',
+            coren='10.400'
+        )
+        Address.objects.create(user=professional.user, city='Ouro Preto', state='MG')
+        response = client.get('/professionals/facets.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'occupation': {'CI': 1, 'EM': 1},
+            'skills': {'AC': 1, 'AD': 0, 'CV': 0, 'HC': 1},
+            'state': {'MG': 2},
+            'city': {'Longa vida': 1, 'Ouro Preto': 1},
+        })
+        response = client.get('/professionals/facets.json', {'occupation': 'EM'})
+        self.assertEqual(response.json()['city'], {'Ouro Preto': 1})
+        Address.objects.filter(user=professional.user).update(city='Mariana')
+        response = client.get('/professionals/facets.json', {'occupation': 'EM', 'limit': 5})
+        self.assertEqual(response.json()['city'], {'Ouro Preto': 1})
+        professional.user.address.delete()
+        response = client.get('/professionals/facets.json', {'occupation': 'EM', 'limit': 5})
+        self.assertEqual(response.json()['city'], {})
+
+    def test_search_document_follows_changes(self):
+        self.professional.user.full_name = 'Pindamonhangaba Silva'
+        self.professional.user.save()
+        self.professional.user.address.city = 'Ouro Preto'
+        self.professional.user.address.save()
+        professionals = Professional.objects.search('Pindamonhangaba')
+        self.assertEqual(list(professionals), [self.professional])
+        self.assertEqual(list(Professional.objects.search('Preto')), [self.professional])
+        self.assertEqual(list(Professional.objects.search('Lagosta')), [])
+
     def test_create_professional(self):
         data = {
             'state': 'MG',
@@ -226,6 +430,194 @@ class ProfessionalTestREST(TestCase):
         })
         self.assertEqual(response.status_code, 405)
 
+class TestAvailabilitySlots(TestCase):
+
+    def setUp(self):
+        self.professional = Professional.objects.create(
+            user=User.objects.create_user(
+                email='slots@tstd.com',
+                password='abda1234',
+                is_active=True,
+                full_name='Bernardo Lagosta',
+            ),
+            skills=['CI'],
+            occupation='CI',
+            coren='10.400'
+        )
+        self.start = (now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+    def test_occurrences(self):
+        monday = datetime.datetime(2030, 1, 7, 10, tzinfo=datetime.timezone.utc)
+        since = monday - timedelta(days=1)
+        expand = lambda recurrence, week_days, days: list(occurrences(
+            monday, monday + timedelta(hours=2), recurrence, week_days, since, monday + timedelta(days=days),
+        ))
+        self.assertEqual(len(expand(None, None, 14)), 1)
+        self.assertEqual(len(expand('D', None, 14)), 14)
+        weekly = expand('W', ['MON', 'WED'], 14)
+        self.assertEqual([start.strftime('%a') for start, end in weekly], ['Mon', 'Wed', 'Mon', 'Wed'])
+        self.assertEqual(len(expand('W', None, 14)), 2)
+        self.assertEqual(len(expand('M', None, 365)), 12)
+        last_day = datetime.datetime(2030, 1, 31, 10, tzinfo=datetime.timezone.utc)
+        monthly = list(occurrences(last_day, last_day + timedelta(hours=1), 'M', None, since, last_day + timedelta(days=365)))
+        self.assertEqual(len(monthly), 7)
+
+    def pin_now(self):
+        # The horizon counts from now, so whether today's occurrence falls
+        # inside it would otherwise depend on the time of day.
+        return patch('core.models.now', return_value=self.start - timedelta(hours=2))
+
+    def test_slots_follow_availability(self):
+        with self.pin_now():
+            availability = Availability.objects.create(
+                professional=self.professional,
+                start_datetime=self.start,
+                end_datetime=self.start + timedelta(hours=2),
+                recurrence='D',
+            )
+        self.assertEqual(availability.slots.count(), settings.AVAILABILITY_HORIZON)
+        availability.recurrence = None
+        availability.save()
+        self.assertEqual(availability.slots.count(), 1)
+        availability.delete()
+        self.assertEqual(AvailabilitySlot.objects.count(), 0)
+
+    def test_filter_by_window(self):
+        Availability.objects.create(
+            professional=self.professional,
+            start_datetime=self.start,
+            end_datetime=self.start + timedelta(hours=2),
+            recurrence='W',
+            weekly_recurrence=[self.start.strftime('%a').upper()],
+        )
+        date = self.start.date()
+        search = lambda **params: [
+            item['uuid'] for item in client.get('/professionals.json', params).json()['results']
+        ]
+        uuid = str(self.professional.uuid)
+        self.assertEqual(search(start_date=date, start_time='11:00', end_time='13:00'), [uuid])
+        self.assertEqual(search(start_date=date + timedelta(days=7), start_time='09:00', end_time='10:30'), [uuid])
+        self.assertEqual(search(start_date=date, start_time='12:00', end_time='13:00'), [])
+        self.assertEqual(search(start_date=date + timedelta(days=1), end_date=date + timedelta(days=6)), [])
+        response = client.get('/professionals.json', {'start_date': date, 'end_date': date - timedelta(days=1)})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/professionals.json', {'start_time': '11:00', 'end_time': '13:00'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_order_by_coverage(self):
+        partial = Professional.objects.create(
+            user=User.objects.create_user(
+                email='partial@tstd.com',
+                password='abda1234',
+                is_active=True,
+                full_name='Carla Lagosta',
+            ),
+            skills=['CI'],
+            occupation='CI',
+            coren='10.400'
+        )
+        for professional, hours in ((partial, 1), (self.professional, 4)):
+            Availability.objects.create(
+                professional=professional,
+                start_datetime=self.start,
+                end_datetime=self.start + timedelta(hours=hours),
+            )
+        response = client.get('/professionals.json', {
+            'start_date': self.start.date(),
+            'start_time': '10:00',
+            'end_time': '14:00',
+        })
+        self.assertEqual(
+            [item['uuid'] for item in response.json()['results']],
+            [str(self.professional.uuid), str(partial.uuid)],
+        )
+        coverage = Professional.objects.with_coverage(self.start, self.start + timedelta(hours=4))
+        self.assertEqual(coverage.get(pk=partial.pk).coverage, 0.25)
+
+    def test_expand_command(self):
+        with self.pin_now():
+            availability = Availability.objects.create(
+                professional=self.professional,
+                start_datetime=self.start,
+                end_datetime=self.start + timedelta(hours=2),
+                recurrence='D',
+            )
+            availability.slots.order_by('-period').first().delete()
+            call_command('expand_availabilities', stdout=StringIO())
+        self.assertEqual(availability.slots.count(), settings.AVAILABILITY_HORIZON)
+
+
+class TestQueryBudget(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.professional = Professional.objects.create(
+            user=User.objects.create_user(
+                email='budget@tstd.com',
+                password='abda1234',
+                is_active=True,
+            ),
+            skills=['CI'],
+            occupation='CI',
+            coren='10.400'
+        )
+        self.client.force_login(self.professional.user)
+        self.seeded = 0
+
+    def seed_professionals(self, amount):
+        users = User.objects.bulk_create(
+            User(email=f'budget{self.seeded + index}@tstd.com', full_name='Bernardo', is_active=True)
+            for index in range(amount)
+        )
+        self.seeded += amount
+        Address.objects.bulk_create(
+            Address(user=user, city='Longa vida', state='MG')
+            for user in users
+        )
+        Professional.objects.bulk_create(
+            Professional(user=user, skills=['CI'], occupation='CI', coren='10.400')
+            for user in users
+        )
+
+    def seed_availabilities(self, amount):
+        Availability.objects.bulk_create(
+            Availability(
+                professional=self.professional,
+                start_datetime=now() + timedelta(days=1),
+                end_datetime=now() + timedelta(days=1, hours=2),
+            )
+            for _ in range(amount)
+        )
+
+    def seed_cash_outs(self, amount):
+        cash_outs = CashOut.objects.bulk_create(
+            CashOut(professional=self.professional, value=0, pagarme_id='1', was_withdrawn=True)
+            for _ in range(amount)
+        )
+        GatewayTransfer.objects.bulk_create(
+            GatewayTransfer(cash_out=cash_out, pagarme_id='1', status='pending_transfer', data={'id': 1})
+            for cash_out in cash_outs
+        )
+
+    def test_professionals(self):
+        self.assertConstantQueries(self.seed_professionals, '/professionals.json', limit=100)
+
+    def test_availabilities(self):
+        url = f'/professionals/{self.professional.uuid}/availabilities.json'
+        self.assertConstantQueries(self.seed_availabilities, url)
+
+    def test_self_availabilities(self):
+        self.assertConstantQueries(self.seed_availabilities, '/profile/availabilities.json')
+
+    def test_cash_outs(self):
+        self.assertConstantQueries(self.seed_cash_outs, '/profile/cash_out.json')
+
+    def test_profile(self):
+        Address.objects.create(user=self.professional.user, city='Longa vida', state='MG')
+        self.assertConstantQueries(self.seed_cash_outs, '/profile.json', expand='cash')
+        # The session, the authenticated user and the user with its address
+        # and professional profile.
+        self.assertEqual(self.count_queries('/profile.json'), 3)
+
 class TestUserREST(TestCase):
 
     def setUp(self):
@@ -568,7 +960,7 @@ class TestUserREST(TestCase):
         self.assertEqual(response.get('Content-Type'), 'application/json', response.content)
         self.assertIn('id', response.json())
 
-    @patch('pagarme.transfer.create', side_effect=pagarme_mock)
+    @patch('financial.gateway.create_transfer', side_effect=pagarme_mock)
     def test_to_withdraw(self, mock):
         client.login(username=self.professional.user.email, password='abda1234')
         response = client.post(f'/profile/cash_out.json')
@@ -576,8 +968,8 @@ class TestUserREST(TestCase):
         self.assertEqual(response.get('Content-Type'), 'application/json', response.content)
         self.assertIn('transfer', response.json())
 
-    @patch('pagarme.transfer.create', side_effect=pagarme_mock)
-    @patch('pagarme.transfer.cancel', side_effect=pagarme_mock)
+    @patch('financial.gateway.create_transfer', side_effect=pagarme_mock)
+    @patch('financial.gateway.cancel_transfer', side_effect=pagarme_mock)
     def test_to_cancel_cash_out(self, *args, **kwargs):
         client.login(username=self.professional.user.email, password='abda1234')
         cash_out = CashOut.create_withdraw(self.professional)
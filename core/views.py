@@ -1,27 +1,60 @@
-from financial.models import CashOut
+from financial import cache as pagarme_cache, postbacks
+from financial.models import CashOut, PostbackEvent
 from core.serializers import AvailabilitiesSerializer
-from django.db.models.query_utils import Q
 from . import models, serializers, forms
 import datetime
+import math
+import requests
+from django.conf import settings
 from rest_framework import viewsets, mixins
-from django.contrib.postgres.search import SearchVector
 from django.utils.dateparse import parse_time, parse_date
+from django.utils.timezone import make_aware
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import action
 from rest_framework.permissions import BasePermission, IsAuthenticated, AllowAny
 import financial.serializers as financial
-
-def get_week(date: str) -> int:
-    if not date: return None
-    return datetime.datetime.strftime(date, "%Y-%m-%d").weekday()
-
-def get_day(date: str) -> int:
-    if not date: return None
-    return datetime.datetime.strftime(date, "%Y-%m-%d").day
-
-def professional_postback(request, uuid):
-    pass
+from api.pagination import KeysetPagination
+from .cache import cached_search
+
+def get_window(params):
+    start_date = parse_date(params.get('start_date', ''))
+    start_time = parse_time(params.get('start_time', ''))
+    end_date = parse_date(params.get('end_date', ''))
+    end_time = parse_time(params.get('end_time', ''))
+    if not any((start_date, start_time, end_date, end_time)):
+        return None
+    if not (start_date or end_date):
+        # Times are matched against the slots of a day, so they need one.
+        raise ValidationError({'start_date': 'A date is required to filter by time'})
+    start = make_aware(datetime.datetime.combine(
+        start_date or end_date,
+        start_time or datetime.time.min,
+    ))
+    end = make_aware(datetime.datetime.combine(
+        end_date or start_date,
+        end_time or datetime.time.max,
+    ))
+    if end < start:
+        raise ValidationError({'end_date': 'The end cannot be before the start'})
+    return start, end
+
+def gateway_unavailable():
+    return Response({'error': 'The payment gateway is unavailable, try again later'}, status=503)
+
+def get_budget(params):
+    if not params.get('budget'):
+        return None
+    try:
+        budget = float(params['budget'])
+    except ValueError:
+        budget = 0
+    if not math.isfinite(budget) or budget <= 0:
+        raise ValidationError({'budget': 'The budget must be a positive number'})
+    return budget
+
+professional_postback = postbacks.receiver(PostbackEvent.RECIPIENT)
 
 class IsProfessional(BasePermission):
     def has_permission(self, request, view):
@@ -35,65 +68,77 @@ class Professionals(
     model = models.Professional
     serializer_class = serializers.PublicProfessionalSerializer
     lookup_field = 'uuid'
-    queryset = models.Professional.objects.filter(user__is_active=True).all()
+    queryset = models.Professional.objects.filter(user__is_active=True).select_related('user', 'user__address')
+    pagination_class = KeysetPagination
 
-    @property
-    def paginated_by(self):
-        return int(self.request.GET.get('limit', [10])[0])
+    orderings = {
+        'relevance': ('-relevance',),
+        'rating': ('-rating', '-rating_count'),
+        'price': ('price',),
+    }
+
+    def filter_queryset(self, queryset):
+        params = self.request.query_params
+        ordering = params.get('ordering', 'relevance')
+        if ordering not in self.orderings:
+            raise ValidationError({'ordering': f'Choose one of {", ".join(self.orderings)}'})
+        filters = dict(filter(lambda item: item[1], dict(
+            skills__overlap=params.getlist('skills'),
+            user__address__city__search=params.get('city'),
+            user__address__state=params.get('state'),
+            occupation=params.get('occupation'),
+        ).items()))
+        queryset = queryset.filter(**filters).with_rating().with_price()
+        window = get_window(params)
+        if window:
+            queryset = queryset.available(*window).with_coverage(*window)
+        search = params.get('search')
+        if search:
+            queryset = queryset.search(search)
+        budget = get_budget(params)
+        if budget:
+            queryset = queryset.with_price_fit(budget)
+        if ordering == 'relevance':
+            queryset = queryset.with_relevance()
+        return queryset.order_by(*self.orderings[ordering], '-id')
 
     def list(self, request, *args, **kwargs):
-        verify_dict = lambda dic: dict(filter(lambda item: item[1] != None and item[1] != [None], dic.items()))
-        filters = {
-            **self.request.GET,
-            'start_time': parse_time(self.request.GET.get('start_time', '')),
-            'start_date': parse_date(self.request.GET.get('start_date', '')),
-            'end_time': parse_time(self.request.GET.get('end_time', '')),
-            'end_date': parse_date(self.request.GET.get('end_date', '')),
-            'skills': self.request.GET.get('skills'),
-        }
-        filter_by_date = verify_dict(dict(
-            availabilities__start_datetime__time__gte=filters.get('start_time'),
-            availabilities__start_datetime__date__gte=filters.get('start_date'),
-            availabilities__end_datetime__time__lte=filters.get('end_time'),
-            availabilities__end_datetime_date__lte=filters.get('end_date'),
-            availabilities__recurrence__isnull=True,
-        ))
-        filter_by_time = verify_dict(dict(
-            availabilities__start_datetime__time__gte=filters.get('start_time'),
-            availabilities__end_datetime__time__lte=filters.get('end_time'),
-            availabilities__recurrence='D',
-        ))
-        filter_by_week_day = verify_dict(dict(
-            availabilities__start_datetime__time__gte=filters.get('start_time'),
-            availabilities__start_datetime__date__iso_week_day=get_week(filters.get('start_date')),
-            availabilities__end_datetime__time__lte=filters.get('end_time'),
-            availabilities__end_datetime_date__iso_week_day=get_week(filters.get('end_date')),
-            availabilities__recurrence='W',
-        ))
-        filter_by_day = verify_dict(dict(
-            availabilities__start_datetime__time__gte=filters.get('start_time'),
-            availabilities__start_datetime__date__day=get_day(filters.get('start_date')),
-            availabilities__end_datetime__time__lte=filters.get('end_time'),
-            availabilities__end_datetime_date__day=get_day(filters.get('end_date')),
-            availabilities__recurrence='M',
-        ))
-        filter_by_attrs = verify_dict(dict(
-            user__is_active=True,
-            skills__overlap=filters.get('skills'),
-            user__address__city__search=list(filters.get('city', [None]))[0],
-            user__address__state=list(filters.get('state', [None]))[0],
-            occupation=list(filters.get('occupation', [None]))[0],
-            search=filters.get('search', [None])[0],
-        ))
-        queryset = self.queryset.annotate(
-                search=SearchVector('user__full_name', 'occupation', 'skills', 'coren', 'about', 'user__email', 'user__address__city')
-            ).filter(
-            Q(**filter_by_date) | Q(**filter_by_time) | 
-            Q(**filter_by_week_day) | Q(**filter_by_day),
-            **filter_by_attrs
+        def results():
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+        return Response(cached_search('list', request, results, settings.SEARCH_CACHE_TIMEOUT))
+
+    @action(methods=['get'], detail=False)
+    def autocomplete(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if len(text) < 2:
+            return Response([])
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 20)
+        except ValueError:
+            limit = 10
+        matches = self.get_queryset().autocomplete(text, limit)
+        return Response([
+            {
+                'uuid': match['uuid'],
+                'full_name': match['user__full_name'],
+                'city': match['user__address__city'],
+                'occupation': match['occupation'],
+            }
+            for match in matches
+        ])
+
+    @action(methods=['get'], detail=False)
+    def facets(self, request, *args, **kwargs):
+        facets = cached_search(
+            'facets', request,
+            lambda: self.filter_queryset(self.get_queryset()).facets(),
+            settings.FACETS_CACHE_TIMEOUT,
+            ignored=('cursor', 'limit', 'format'),
         )
-        serializer = self.serializer_class(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response(facets)
 
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
@@ -104,9 +149,10 @@ class Professionals(
         return Response(serializer.errors, status=400)
 
     def retrieve(self, request, uuid=None, *args, **kwargs):
-        professional = get_object_or_404(self.queryset, uuid=uuid)
-        serializer = self.serializer_class(instance=professional, context={'request': request})
-        return Response(serializer.data)
+        def professional():
+            instance = get_object_or_404(self.queryset, uuid=uuid)
+            return self.serializer_class(instance=instance, context={'request': request}).data
+        return Response(cached_search('retrieve', request, professional, settings.SEARCH_CACHE_TIMEOUT))
 
     @action(methods=['get'], detail=True)
     def availabilities(self, request, uuid, *args, **kwargs):
@@ -133,6 +179,7 @@ class Users(viewsets.ViewSet):
         'cash_out': financial.CashOutSerializer,
         'to_withdraw': financial.CashOutSerializer,
     }
+    select_related = ('address', 'professional')
 
     @property
     def serializer_class(self):
@@ -149,18 +196,39 @@ class Users(viewsets.ViewSet):
             return (IsAuthenticated(),)
         return super(Users, self).get_permissions()
 
+    def get_user(self, request):
+        """
+        Reloads the authenticated user with the relations the profile
+        renders, so the serializers find them already fetched.
+        """
+        request.user = models.User.objects.select_related(*self.select_related).get(pk=request.user.pk)
+        return request.user
+
     def get(self, request, *args, **kwargs):
-        serializer = self.serializer_class(instance=request.user, many=False, context={'request': request})
+        user = self.get_user(request)
+        expand = serializers.get_expand(request)
+        lookups = {}
+        if 'customer' in expand and user.saved_in_pagarme:
+            lookups['customer'] = ('customer', user.pagarme_id)
+        if 'recipient' in expand and user.is_professional and user.professional.saved_in_pagarme:
+            lookups['recipient'] = ('recipient', user.professional.pagarme_id)
+        found = pagarme_cache.lookup_many(lookups.values())
+        serializer = self.serializer_class(instance=user, many=False, context={
+            'request': request,
+            'expand': expand,
+            'gateway': {name: found[key] for name, key in lookups.items()},
+        })
         return Response(data=serializer.data)
 
     def put(self, request, *args, **kwargs):
+        user = self.get_user(request)
         serializer = self.serializer_class(
             data=request.data,
             context={'request': request},
-            instance=request.user
+            instance=user
         )
         if serializer.is_valid():
-            serializer.update(request.user, serializer.validated_data)
+            serializer.update(user, serializer.validated_data)
             return Response(data=serializer.data)
         return Response(data=serializer.errors, status=400)
 
@@ -201,8 +269,12 @@ class Users(viewsets.ViewSet):
     @action(methods=['get'], detail=False)
     def customer(self, request, *args, **kwargs):
         user: models.User = request.user
-        if user.customer:
-            return Response(user.customer)
+        try:
+            customer = user.customer
+        except requests.RequestException:
+            return gateway_unavailable()
+        if customer:
+            return Response(customer)
         return Response(status=404)
 
     @customer.mapping.post
@@ -219,7 +291,10 @@ class Users(viewsets.ViewSet):
 
     @action(methods=['get'], detail=False)
     def cards(self, request, *args, **kwargs):
-        return Response(request.user.cards)
+        try:
+            return Response(request.user.cards)
+        except requests.RequestException:
+            return gateway_unavailable()
 
     @cards.mapping.post
     def create_card(self, request, *args, **kwargs):
@@ -231,7 +306,10 @@ class Users(viewsets.ViewSet):
 
     @action(methods=['get'], detail=False, permission_classes=[IsAuthenticated, IsProfessional])
     def recipient(self, request, *args, **kwargs):
-        recipient = request.user.professional.recipient
+        try:
+            recipient = request.user.professional.recipient
+        except requests.RequestException:
+            return gateway_unavailable()
         if recipient:
             return Response(data=recipient)
         return Response(status=404)
@@ -247,7 +325,7 @@ class Users(viewsets.ViewSet):
     @action(methods=['get'], detail=False, permission_classes=[IsAuthenticated, IsProfessional])
     def cash_out(self, request, *args, **kwargs):
         serializer = self.serializer_class(
-            instance=request.user.professional.cash_outs,
+            instance=request.user.professional.cash_outs.select_related('gateway_transfer'),
             context={'request': request},
             many=True,
         )
@@ -273,14 +351,20 @@ class PrivateAvailabilities(viewsets.ViewSet):
     lookup_field = 'uuid'
     permission_classes = [IsAuthenticated, IsProfessional]
     basename = 'SelfAvailabilities'
+    # AvailabilitiesSerializer only reads local fields, so the rows need no
+    # related objects.
+    select_related = ()
 
     @property
     def queryset(self):
-        return self.request.user.professional.availabilities.all()
+        queryset = self.request.user.professional.availabilities.all()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        return queryset
 
     def list(self, request, *args, **kwargs):
         serializer = serializers.AvailabilitiesSerializer(
-            request.user.professional.availabilities.all(),
+            self.queryset,
             many=True,
         )
         return Response(serializer.data)
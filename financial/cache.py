@@ -0,0 +1,132 @@
+"""
+Shared cache for the Pagar.me lookups.
+
+Entries live in the default cache for `PAGARME_CACHE_TIMEOUT` seconds and
+concurrent misses for the same key in a process share one upstream call.
+A stale copy is kept for `PAGARME_STALE_TIMEOUT` seconds and served when
+the gateway cannot be reached.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from . import gateway
+
+FETCHERS = {
+    'customer': 'get_customer',
+    'cards': 'list_cards',
+    'recipient': 'get_recipient',
+}
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time; the callers that arrive while it runs
+    wait for it and get its result or its exception.
+    """
+
+    class Call:
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+flights = SingleFlight()
+executor = None
+
+
+def cache_key(kind, pagarme_id):
+    return f'pagarme:{kind}:{pagarme_id}'
+
+
+def stale_key(kind, pagarme_id):
+    return f'pagarme:stale:{kind}:{pagarme_id}'
+
+
+def lookup(kind, pagarme_id):
+    key = cache_key(kind, pagarme_id)
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    def fetch():
+        value = cache.get(key)
+        if value is None:
+            try:
+                value = getattr(gateway, FETCHERS[kind])(pagarme_id)
+            except requests.RequestException:
+                value = cache.get(stale_key(kind, pagarme_id))
+                if value is None:
+                    raise
+                return value
+            cache.set(key, value, settings.PAGARME_CACHE_TIMEOUT)
+            cache.set(stale_key(kind, pagarme_id), value, settings.PAGARME_STALE_TIMEOUT)
+        return value
+    return flights.do(key, fetch)
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        with flights.lock:
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=len(FETCHERS),
+                    thread_name_prefix='pagarme-lookup',
+                )
+    return executor
+
+
+def lookup_many(keys):
+    """
+    Looks up several `(kind, pagarme_id)` pairs at once, the cache misses
+    concurrently. Returns each value, or the exception its lookup raised.
+    """
+    keys = list(keys)
+    cached = cache.get_many([cache_key(*key) for key in keys])
+    results = {key: cached[cache_key(*key)] for key in keys if cache_key(*key) in cached}
+    misses = [key for key in keys if key not in results]
+    # The first miss is looked up in this thread while the pool takes the rest.
+    futures = {key: get_executor().submit(lookup, *key) for key in misses[1:]}
+    for key in misses[:1]:
+        try:
+            results[key] = lookup(*key)
+        except Exception as error:
+            results[key] = error
+    for key, future in futures.items():
+        error = future.exception()
+        results[key] = error if error is not None else future.result()
+    return results
+
+
+def invalidate(kind, pagarme_id):
+    cache.delete(cache_key(kind, pagarme_id))
@@ -0,0 +1,303 @@
+"""
+In-memory stand-in for the Pagar.me endpoints the project uses.
+
+It runs in a thread of the current process or through the
+`fake_pagarme` command, adds latency and errors on demand and sends the
+postbacks Pagar.me would send, signed with the API key.
+
+    with FakePagarme(latency=0.05, error_rate=0.01) as fake:
+        with override_settings(PAGARME_API_URL=fake.url):
+            ...
+"""
+import base64
+import calendar
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+import requests
+
+DEFAULT_RECIPIENTS = {'live': 're_default_live', 'test': 're_default_test'}
+
+
+def flatten(data, prefix=''):
+    """
+    Form-encodes nested objects the way Pagar.me postbacks do.
+    """
+    items = []
+    for key, value in data.items():
+        name = f'{prefix}[{key}]' if prefix else key
+        if isinstance(value, dict):
+            items.extend(flatten(value, name))
+        elif isinstance(value, list):
+            items.extend(
+                pair
+                for index, item in enumerate(value)
+                for pair in (flatten(item, f'{name}[{index}]') if isinstance(item, dict) else [(f'{name}[{index}]', item)])
+            )
+        elif value is not None:
+            items.append((name, value))
+    return items
+
+
+def isoformat(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + f'.{int(seconds * 1000) % 1000:03d}Z'
+
+
+def parse_date(value):
+    return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')) * 1000 + int(value[20:23])
+
+
+def filters(condition):
+    """
+    Parses a list filter such as `>=1609459200000`, in milliseconds.
+    """
+    match = re.fullmatch(r'(>=|<=|>|<|=)?(\d+)', condition or '')
+    if match is None:
+        return lambda value: True
+    operator, bound = match.group(1) or '=', int(match.group(2))
+    return {
+        '>=': lambda value: value >= bound,
+        '<=': lambda value: value <= bound,
+        '>': lambda value: value > bound,
+        '<': lambda value: value < bound,
+        '=': lambda value: value == bound,
+    }[operator]
+
+
+class FakePagarme:
+
+    def __init__(self, host='127.0.0.1', port=0, api_key=None, latency=0, error_rate=0,
+                 error_status=503, transaction_status='paid', postback_delay=0.1,
+                 deliver_postbacks=True):
+        self.api_key = api_key
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.transaction_status = transaction_status
+        self.postback_delay = postback_delay
+        self.deliver_postbacks = deliver_postbacks
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.objects = {kind: {} for kind in ('customers', 'cards', 'recipients', 'transactions', 'transfers')}
+        self.postbacks = []
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/1'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.dispatch('GET')
+
+            def do_POST(self):
+                self.dispatch('POST')
+
+            def dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null') or {}
+                url = urlparse(self.path)
+                status, data = fake.handle(method, url.path, parse_qs(url.query), body, self.headers)
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def authorized(self, headers):
+        if self.api_key is None:
+            return True
+        scheme, _, credentials = headers.get('Authorization', '').partition(' ')
+        if scheme != 'Basic':
+            return False
+        return base64.b64decode(credentials).decode().split(':')[0] == self.api_key
+
+    def routes(self):
+        return (
+            ('POST', r'customers', self.create_customer),
+            ('GET', r'customers/(\w+)', lambda body, query, id: self.get('customers', id)),
+            ('POST', r'cards', self.create_card),
+            ('GET', r'cards', self.list_cards),
+            ('POST', r'recipients', self.create_recipient),
+            ('GET', r'recipients/(\w+)', lambda body, query, id: self.get('recipients', id)),
+            ('GET', r'company', lambda body, query: (200, {'default_recipient_id': DEFAULT_RECIPIENTS})),
+            ('POST', r'transactions', self.create_transaction),
+            ('GET', r'transactions', self.list_transactions),
+            ('GET', r'transactions/(\w+)', lambda body, query, id: self.get('transactions', id)),
+            ('POST', r'transfers', self.create_transfer),
+            ('GET', r'transfers', lambda body, query: self.list('transfers', query)),
+            ('GET', r'transfers/(\w+)', lambda body, query, id: self.get('transfers', id)),
+            ('POST', r'transfers/(\w+)/cancel', self.cancel_transfer),
+        )
+
+    def handle(self, method, path, query, body, headers):
+        if self.latency:
+            time.sleep(random.uniform(*self.latency) if isinstance(self.latency, tuple) else self.latency)
+        if not self.authorized(headers):
+            return 401, {'errors': [{'message': 'api_key inválida'}]}
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status, {'errors': [{'message': 'Injected error'}]}
+        path = re.sub(r'^/(1/)?', '', path).rstrip('/')
+        query = {key: values[-1] for key, values in query.items()}
+        for route_method, pattern, view in self.routes():
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self.lock:
+                    return view(body, query, *match.groups())
+        return 404, {'errors': [{'message': 'Not found'}]}
+
+    def new(self, kind, data, prefix=''):
+        id = next(self.ids)
+        self.objects[kind][str(id)] = data = self.touch({
+            **data,
+            'object': kind[:-1],
+            'id': f'{prefix}{id}' if prefix else id,
+            'date_created': isoformat(time.time()),
+        })
+        return data
+
+    def touch(self, data, **changes):
+        data.update(changes, date_updated=isoformat(time.time()))
+        return data
+
+    def settle(self, kind, data, status):
+        """
+        Stores the status the object moves to after the response is sent.
+        """
+        key = re.sub(r'^\D+_', '', str(data['id']))
+        self.objects[kind][key] = self.touch(dict(data), status=status)
+        return self.objects[kind][key]
+
+    def get(self, kind, id):
+        data = self.objects[kind].get(re.sub(r'^\D+_', '', id))
+        if data is None:
+            return 404, {'errors': [{'message': f'{kind[:-1]} not found'}]}
+        return 200, data
+
+    def list(self, kind, query, match=lambda data: True):
+        count = int(query.get('count', 10))
+        page = int(query.get('page', 1))
+        updated = filters(query.get('date_updated'))
+        results = [
+            data for data in reversed(list(self.objects[kind].values()))
+            if match(data) and updated(parse_date(data['date_updated']))
+        ]
+        return 200, results[(page - 1) * count:page * count]
+
+    def create_customer(self, body, query):
+        return 200, self.new('customers', body)
+
+    def create_card(self, body, query):
+        number = str(body.get('card_number', '0000'))
+        return 200, self.new('cards', {
+            'customer': {'id': body.get('customer_id')},
+            'last_digits': number[-4:],
+            'holder_name': body.get('card_holder_name'),
+            'valid': True,
+        }, prefix='card_')
+
+    def list_cards(self, body, query):
+        customer = str(query.get('customer_id'))
+        return self.list('cards', {'count': 100}, lambda card: str(card['customer']['id']) == customer)
+
+    def create_recipient(self, body, query):
+        recipient = self.new('recipients', {**body, 'status': 'registration'}, prefix='re_')
+        recipient = self.settle('recipients', recipient, 'active')
+        self.postback(body.get('postback_url'), 'recipient', recipient, 'registration')
+        return 200, recipient
+
+    def create_transaction(self, body, query):
+        status = self.transaction_status
+        if body.get('async'):
+            transaction = self.new('transactions', {**body, 'status': 'processing'})
+            settled = self.settle('transactions', transaction, status)
+            self.postback(body.get('postback_url'), 'transaction', settled, 'processing')
+            return 200, transaction
+        return 200, self.new('transactions', {**body, 'status': status})
+
+    def list_transactions(self, body, query):
+        payment = (body.get('metadata') or {}).get('payment')
+        return self.list(
+            'transactions', query,
+            lambda transaction: payment is None or transaction.get('metadata', {}).get('payment') == payment,
+        )
+
+    def create_transfer(self, body, query):
+        return 200, self.new('transfers', {**body, 'status': 'pending_transfer'})
+
+    def cancel_transfer(self, body, query, id):
+        status, transfer = self.get('transfers', id)
+        if status == 200:
+            self.touch(transfer, status='canceled')
+        return status, transfer
+
+    def postback(self, url, kind, data, old_status):
+        if not url:
+            return
+        if '://' not in url:
+            url = f'http://{url}'
+        body = urlencode(flatten({
+            'id': data['id'],
+            'fingerprint': hashlib.sha1(f'{data["id"]}#{self.api_key}'.encode()).hexdigest(),
+            'event': f'{kind}_status_changed',
+            'object': kind,
+            'old_status': old_status,
+            'desired_status': data['status'],
+            'current_status': data['status'],
+            kind: data,
+        }))
+        signature = hmac.new((self.api_key or '').encode(), body.encode(), hashlib.sha1).hexdigest()
+        postback = (url, body, {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'X-Hub-Signature': f'sha1={signature}',
+        })
+        self.postbacks.append(postback)
+        if self.deliver_postbacks:
+            timer = threading.Timer(self.postback_delay, self.deliver, postback)
+            timer.daemon = True
+            timer.start()
+
+    def deliver(self, url, body, headers):
+        try:
+            requests.post(url, data=body, headers=headers, timeout=5)
+        except requests.RequestException:
+            pass
@@ -0,0 +1,261 @@
+"""
+Client for the Pagar.me API.
+
+Every call goes through one keep-alive session with explicit connect and
+read timeouts per operation. Only GETs are retried, with jittered
+exponential backoff, so a payment or transfer is never sent twice.
+
+Calls are limited to `PAGARME_MAX_CONCURRENCY` in flight per process and
+each endpoint class (customers, cards, transactions...) has a circuit
+breaker, so a failing endpoint is answered with `Unavailable` right away
+instead of tying up workers.
+"""
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+# (connect, read) seconds
+TIMEOUTS = {
+    'read': (3.05, 10),
+    'write': (3.05, 20),
+    'transaction': (3.05, 40),
+}
+RETRIES = 2
+BACKOFF = 0.25
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_slots = None
+breakers = {}
+
+
+class GatewayError(Exception):
+
+    def __init__(self, errors, status=None):
+        super().__init__(errors)
+        self.errors = errors
+        self.status = status
+
+
+class Unavailable(requests.ConnectionError):
+    """
+    The call was not sent, because the circuit is open or the process
+    already has too many calls in flight.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset` seconds. Then one probe is let through: a success closes the
+    circuit and a failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, threshold, reset):
+        self.name = name
+        self.threshold = threshold
+        self.reset = reset
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.probing or time.monotonic() - self.opened_at >= self.reset:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset:
+                return False
+            self.probing = True
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+def get_breaker(path):
+    name = path.lstrip('/').split('?')[0].split('/')[0]
+    breaker = breakers.get(name)
+    if breaker is None:
+        with _session_lock:
+            breaker = breakers.setdefault(name, CircuitBreaker(
+                name,
+                settings.PAGARME_BREAKER_THRESHOLD,
+                settings.PAGARME_BREAKER_RESET,
+            ))
+    return breaker
+
+
+def get_slots():
+    global _slots
+    if _slots is None:
+        with _session_lock:
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(settings.PAGARME_MAX_CONCURRENCY)
+    return _slots
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.PAGARME_POOL_SIZE,
+                    max_retries=0,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['User-Agent'] = f'api python/{sys.version.split(" ", 1)[0]}'
+                _session = session
+    return _session
+
+
+def backoff(attempt):
+    return random.uniform(0, BACKOFF * 2 ** attempt)
+
+
+def request(method, path, data=None, operation='read'):
+    url = f'{settings.PAGARME_API_URL.rstrip("/")}/{path.lstrip("/")}'
+    breaker = get_breaker(path)
+    attempts = 1 + (RETRIES if method == 'GET' else 0)
+    for attempt in range(attempts):
+        last = attempt + 1 == attempts
+        try:
+            response = send(breaker, method, url, data, operation)
+        except Unavailable:
+            raise
+        except (requests.ConnectionError, requests.Timeout):
+            if last:
+                raise
+        else:
+            if last or response.status_code not in RETRY_STATUSES:
+                return parse(response)
+        time.sleep(backoff(attempt))
+
+
+def send(breaker, method, url, data, operation):
+    slots = get_slots()
+    if not slots.acquire(timeout=settings.PAGARME_QUEUE_TIMEOUT):
+        raise Unavailable('Too many calls to the payment gateway in flight')
+    try:
+        if not breaker.allow():
+            raise Unavailable(f'The payment gateway {breaker.name} endpoint is unavailable')
+        try:
+            response = get_session().request(
+                method, url, json=data, timeout=TIMEOUTS[operation],
+                auth=(settings.PAGARME_API_KEY or '', ''),
+            )
+        except requests.RequestException:
+            breaker.failure()
+            raise
+        if response.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        return response
+    finally:
+        slots.release()
+
+
+def parse(response):
+    try:
+        body = response.json()
+    except ValueError:
+        body = {'errors': [{'message': response.text}]}
+    if not response.ok:
+        raise GatewayError(body.get('errors', body), response.status_code)
+    return body
+
+
+def get(path, data=None):
+    return request('GET', path, data)
+
+
+def post(path, data=None, operation='write'):
+    return request('POST', path, data, operation)
+
+
+def get_customer(customer_id):
+    return get(f'customers/{customer_id}')
+
+
+def create_customer(data):
+    return post('customers', data)
+
+
+def list_cards(customer_id):
+    return get(f'cards?customer_id={customer_id}')
+
+
+def create_card(data):
+    return post('cards', data)
+
+
+def get_recipient(recipient_id):
+    return get(f'recipients/{recipient_id}')
+
+
+def create_recipient(data):
+    return post('recipients', data)
+
+
+def default_recipient():
+    return get('company')['default_recipient_id']
+
+
+def find_transactions(search):
+    return get('transactions', search)
+
+
+def list_transactions(params):
+    return get(f'transactions?{urlencode(params)}')
+
+
+def create_transaction(data):
+    return post('transactions', data, operation='transaction')
+
+
+def get_transfer(transfer_id):
+    return get(f'transfers/{transfer_id}')
+
+
+def list_transfers(params):
+    return get(f'transfers?{urlencode(params)}')
+
+
+def create_transfer(data):
+    return post('transfers', data)
+
+
+def cancel_transfer(transfer_id):
+    return post(f'transfers/{transfer_id}/cancel')
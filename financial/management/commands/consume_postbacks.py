@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from financial import postbacks
+
+
+class Command(BaseCommand):
+    help = 'Applies the postbacks waiting in the inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the inbox and exit')
+        parser.add_argument('--interval', type=float, default=1)
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, once, interval, batch_size, **options):
+        while True:
+            consumed = total = postbacks.consume(batch_size)
+            while consumed == batch_size:
+                consumed = postbacks.consume(batch_size)
+                total += consumed
+            if total:
+                self.stdout.write(f'{total} postbacks consumed')
+            if once:
+                return
+            time.sleep(interval)
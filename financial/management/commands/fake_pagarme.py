@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from financial.fake_gateway import FakePagarme
+
+
+class Command(BaseCommand):
+    help = 'Serves a local fake of the Pagar.me API for development and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--api-key', default=None, help='Defaults to PAGARME_API_KEY')
+        parser.add_argument(
+            '--latency', type=float, nargs='+', default=[0],
+            help='Seconds added to each request, or a min and max to draw from',
+        )
+        parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests that fail')
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument('--transaction-status', default='paid', help='Status transactions settle on')
+        parser.add_argument('--postback-delay', type=float, default=0.1)
+        parser.add_argument('--no-postbacks', action='store_true', help='Record postbacks without sending them')
+
+    def handle(self, *args, host, port, api_key, latency, error_rate, error_status,
+               transaction_status, postback_delay, no_postbacks, **options):
+        fake = FakePagarme(
+            host=host,
+            port=port,
+            api_key=api_key or settings.PAGARME_API_KEY,
+            latency=tuple(latency) if len(latency) > 1 else latency[0],
+            error_rate=error_rate,
+            error_status=error_status,
+            transaction_status=transaction_status,
+            postback_delay=postback_delay,
+            deliver_postbacks=not no_postbacks,
+        )
+        self.stdout.write(f'Serving the fake Pagar.me API at {fake.url}')
+        self.stdout.write('Set PAGARME_API_URL to it to use it')
+        try:
+            fake.serve_forever()
+        except KeyboardInterrupt:
+            fake.server.server_close()
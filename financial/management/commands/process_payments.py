@@ -0,0 +1,28 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from financial import payments
+
+
+class Command(BaseCommand):
+    help = 'Submits the pending payments and polls the open transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+        parser.add_argument('--interval', type=float, default=settings.PAYMENT_POLL_INTERVAL)
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, once, interval, batch_size, **options):
+        while True:
+            submitted = sum(
+                payments.process(pk) is not None
+                for pk in payments.pending(grace=interval if settings.PAYMENT_WORKERS else 0)[:batch_size]
+            )
+            polled = [
+                payments.poll(payment)
+                for payment in payments.open_payments(interval)[:batch_size]
+            ]
+            self.stdout.write(f'{submitted} payments submitted, {len(polled)} payments polled')
+            if once:
+                return
+            time.sleep(interval)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from financial import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Updates payments and cash-outs from the transactions and transfers changed in the gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feed', choices=list(reconcile.FEEDS), action='append', help='Defaults to all feeds')
+        parser.add_argument('--page-size', type=int, default=reconcile.PAGE_SIZE)
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoints and read everything')
+
+    def handle(self, *args, feed, page_size, restart, **options):
+        for name in feed or reconcile.FEEDS:
+            matched = reconcile.reconcile(name, page_size, restart)
+            self.stdout.write(f'{matched} {name} reconciled')
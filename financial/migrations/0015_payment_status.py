@@ -0,0 +1,44 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+def set_status(apps, schema_editor):
+    Payment = apps.get_model('financial', 'Payment')
+    Payment.objects.filter(paid=True).update(status='paid')
+    Payment.objects.filter(paid=False, pagarme_id__isnull=False).update(status='processing')
+    Payment.objects.filter(paid=False, pagarme_id__isnull=True).update(status='failed')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0014_cashout_uuid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='card_index',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('submitting', 'Submitting'), ('processing', 'Processing'), ('authorized', 'Authorized'), ('analyzing', 'Analyzing'), ('pending_review', 'Pending review'), ('waiting_payment', 'Waiting payment'), ('paid', 'Paid'), ('refused', 'Refused'), ('pending_refund', 'Pending refund'), ('refunded', 'Refunded'), ('chargedback', 'Chargedback'), ('failed', 'Failed')], default='pending', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'registration_date'], name='financial_payment_status_idx'),
+        ),
+        migrations.RunPython(set_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0015_payment_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostbackEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=40, unique=True)),
+                ('kind', models.CharField(choices=[('payment', 'Payment'), ('recipient', 'Recipient')], max_length=10)),
+                ('target', models.UUIDField()),
+                ('object_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(blank=True, max_length=30, null=True)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postbackevent',
+            index=models.Index(condition=models.Q(processed_at__isnull=True), fields=['id'], name='financial_postback_inbox_idx'),
+        ),
+    ]
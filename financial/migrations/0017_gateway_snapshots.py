@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0016_postback_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GatewayTransfer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pagarme_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(blank=True, max_length=30, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cash_out', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='gateway_transfer', to='financial.cashout')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='GatewayTransaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pagarme_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(blank=True, max_length=30, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='gateway_transaction', to='financial.payment')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
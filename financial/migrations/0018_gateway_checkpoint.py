@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0017_gateway_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GatewayCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True)),
+                ('since', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('page', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+    ]
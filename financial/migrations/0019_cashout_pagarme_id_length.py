@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0018_gateway_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cashout',
+            name='pagarme_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -2,18 +2,57 @@ from functools import reduce
 import re
 from django.core.exceptions import ValidationError
 from django.forms.models import model_to_dict
-import pagarme
-from pagarme.resources import handler_request
 from core.models import Professional
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from pagarme import transaction, transfer
+from django.utils.timezone import now
+from . import gateway
+from .payment_profile import get_payment_profile
 import uuid
 
 User = get_user_model()
 
 class Payment(models.Model):
+    PENDING = 'pending'
+    SUBMITTING = 'submitting'
+    PAID = 'paid'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (SUBMITTING, 'Submitting'),
+        ('processing', 'Processing'),
+        ('authorized', 'Authorized'),
+        ('analyzing', 'Analyzing'),
+        ('pending_review', 'Pending review'),
+        ('waiting_payment', 'Waiting payment'),
+        (PAID, 'Paid'),
+        ('refused', 'Refused'),
+        ('pending_refund', 'Pending refund'),
+        ('refunded', 'Refunded'),
+        ('chargedback', 'Chargedback'),
+        (FAILED, 'Failed'),
+    )
+    FINAL_STATUSES = (PAID, 'refused', 'refunded', 'chargedback', FAILED)
+    # How far along the gateway lifecycle each status is. A payment only
+    # moves forward, and out of a final status only from paid into a
+    # refund or a chargeback.
+    STAGES = {
+        PENDING: 0,
+        SUBMITTING: 0,
+        'processing': 1,
+        'authorized': 2,
+        'analyzing': 2,
+        'pending_review': 2,
+        'waiting_payment': 2,
+        PAID: 3,
+        'refused': 3,
+        FAILED: 3,
+        'pending_refund': 4,
+        'refunded': 5,
+        'chargedback': 5,
+    }
+    REVERSALS = ('pending_refund', 'refunded', 'chargedback')
     uuid = models.UUIDField(
         default=uuid.uuid4,
         unique=True,
@@ -46,39 +85,66 @@ class Payment(models.Model):
         null=True,
         blank=True,
     )
-    __transaction = None
+    status = models.CharField(
+        choices=STATUSES,
+        max_length=15,
+        default=PENDING,
+    )
+    card_index = models.PositiveSmallIntegerField(
+        default=0,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+    )
+    error = models.TextField(
+        null=True,
+        blank=True,
+    )
 
     @property
     def transaction(self):
-        if not self.__transaction:
-            self.__transaction = transaction.find_by({
-                'metadata': {
-                    'payment': self.uuid,
-                }
-            })
-        return self.__transaction
+        snapshot = getattr(self, 'gateway_transaction', None)
+        return snapshot.data if snapshot else None
 
     @property
     def postback_url(self):
         return f'{settings.HOST}/postback/payment/{self.uuid}/'
 
+    @property
+    def is_final(self):
+        return self.status in self.FINAL_STATUSES
+
     def validate_recipient(self):
         if not self.professional.recipient:
             raise ValidationError('The professional should create a recipient account')
 
-    def pay(self, card_index=0):
+    def validate_payer(self):
+        """
+        Checks what can be known without calling the gateway, so a payment
+        that is bound to fail is not queued.
+        """
         self.client.validate_customer()
-        self.client.validate_cards()
-        self.validate_recipient()
+        if not self.professional.saved_in_pagarme:
+            raise ValidationError('The professional should create a recipient account')
         if not hasattr(self.client, 'address'):
             raise ValidationError('The user address is required')
+
+    def submit(self):
+        """
+        Creates the transaction in the gateway. It is created asynchronously,
+        so the status it returns is usually still processing and the result
+        arrives by postback or by `refresh_status`.
+        """
+        self.client.validate_customer()
+        self.client.validate_cards()
+        self.validate_recipient()
+        if self.card_index >= len(self.client.cards):
+            raise ValidationError('Card not found')
         if not self.paid:
             billing_fields = ['zipcode', 'street', 'street_number', 'state', 'city', 'neighborhood']
             address = model_to_dict(instance=self.client.address, fields=billing_fields)
             address['zipcode'] = re.sub('[^0-9]', '', address.get('zipcode'))
-            default_recipient = pagarme.recipient.default_recipient()
-            recipient_status = 'live' if settings.PRODUCTION else 'test'
-            comission = settings.PLATFORM_COMMISSION or 0
+            profile = get_payment_profile()
             customer = {
                 'external_id': str(self.client.uuid),
                 'name': self.client.full_name,
@@ -93,10 +159,10 @@ class Payment(models.Model):
             }
             data = {
                 'amount': int(self.value * 100),
-                'card_id': self.client.cards[card_index]['id'],
+                'card_id': self.client.cards[self.card_index]['id'],
                 'customer': customer,
                 'payment_method': 'credit_card',
-                'async': False,
+                'async': True,
                 'postback_url': self.postback_url,
                 'soft_descriptor': settings.PAYMENT_DESCRIPTION,
                 'billing': {
@@ -121,28 +187,46 @@ class Payment(models.Model):
                     'professional': self.professional.user.full_name,
                     'client': self.client.full_name,
                 },
-                'split_rules': [
-                    {
-                        'recipient_id': default_recipient.get(recipient_status),
-                        'charge_processing_fee': True,
-                        'percentage': comission,
-                        'charge_remainder_fee': True,
-                    },
-                    {
-                        'recipient_id': self.professional.recipient['id'],
-                        'charge_processing_fee': False,
-                        'percentage': (100 - (comission)),
-                        'charge_remainder_fee': False,
-                    },
-                ]
+                'split_rules': profile.split_rules(self.professional.recipient['id']),
             }
-            self.__transaction = transaction.create(data)
-            if self.__transaction.get('status', None) == 'paid':
-                self.paid = True
-                self.pagarme_id = self.__transaction.get('id')
-                self.save(update_fields=['paid', 'pagarme_id'])
+            self.update_status(gateway.create_transaction(data))
         return self.transaction
 
+    def accepts(self, status):
+        """
+        Whether the payment may move to `status`, so an event delivered
+        late cannot take it back to an earlier one.
+        """
+        if status not in self.STAGES:
+            return False
+        if self.status in self.FINAL_STATUSES:
+            return self.status == self.PAID and status in self.REVERSALS
+        return self.STAGES[status] >= self.STAGES.get(self.status, 0)
+
+    def update_status(self, transaction):
+        self.status = transaction.get('status', self.status)
+        self.pagarme_id = transaction.get('id', self.pagarme_id)
+        self.paid = self.status == self.PAID
+        self.error = None
+        self.save(update_fields=['status', 'pagarme_id', 'paid', 'error', 'registration_date'])
+        self.gateway_transaction = GatewayTransaction.store(self, transaction)
+
+    def refresh_status(self):
+        """
+        Looks the transaction up by its metadata and returns it, or None
+        when the gateway has no transaction for the payment.
+        """
+        transactions = gateway.find_transactions({'metadata': {'payment': str(self.uuid)}})
+        if not transactions:
+            return None
+        self.update_status(transactions[0])
+        return self.transaction
+
+    def fail(self, error):
+        self.status = self.FAILED
+        self.error = error
+        self.save(update_fields=['status', 'error', 'registration_date'])
+
     def validate_value(self):
         if self.value != self.job.value:
             raise ValidationError(
@@ -153,6 +237,11 @@ class Payment(models.Model):
         self.validate_value()
         return super(Payment, self).full_clean(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'registration_date'], name='financial_payment_status_idx'),
+        ]
+
 class CashOut(models.Model):
     uuid = models.UUIDField(
         default=uuid.uuid4,
@@ -172,17 +261,15 @@ class CashOut(models.Model):
         default=False,
     )
     pagarme_id = models.CharField(
-        max_length=6,
+        max_length=100,
         null=True,
         blank=True,
     )
-    __transfer = {}
 
     @property
     def transfer(self):
-        if not self.__transfer and self.pagarme_id:
-            self.__transfer = handler_request.get(f'https://api.pagar.me/1/transfers/{self.pagarme_id}')
-        return self.__transfer
+        snapshot = getattr(self, 'gateway_transfer', None)
+        return snapshot.data if snapshot else {}
 
     @classmethod
     def create_withdraw(cls, professional:Professional):
@@ -197,10 +284,12 @@ class CashOut(models.Model):
 
     def cancel_withdraw(self):
         if self.was_withdrawn and self.pagarme_id:
-            self.__transfer = transfer.cancel(self.pagarme_id)
-            if self.__transfer['status'] == 'canceled':
+            transfer = gateway.cancel_transfer(self.pagarme_id)
+            if transfer['status'] == 'canceled':
                 self.was_withdrawn = False
-        return self.__transfer
+                self.save(update_fields=['was_withdrawn'])
+            self.gateway_transfer = GatewayTransfer.store(self, transfer)
+        return self.transfer
 
     def to_withdraw(self):
         if not self.was_withdrawn and not self.pagarme_id:
@@ -208,11 +297,14 @@ class CashOut(models.Model):
                 amount=int(self.value * (100 - settings.CASH_OUT_COMMISSION)),
                 recipient_id=self.professional.pagarme_id
             )
-            self.__transfer = transfer.create(data)
-            if 'id' in self.__transfer:
-                self.pagarme_id = self.__transfer['id']
+            transfer = gateway.create_transfer(data)
+            if 'id' in transfer:
+                self.pagarme_id = transfer['id']
                 self.was_withdrawn = True
-        return self.__transfer
+                self.save(update_fields=['pagarme_id', 'was_withdrawn'])
+                self.gateway_transfer = GatewayTransfer.store(self, transfer)
+            return transfer
+        return self.transfer
 
     def validate_value(self):
         if self.value != self.professional.cash:
@@ -222,4 +314,153 @@ class CashOut(models.Model):
 
     def full_clean(self, *args, **kwargs):
         self.validate_value()
-        return super(CashOut, self).full_clean(*args, **kwargs)
\ No newline at end of file
+        return super(CashOut, self).full_clean(*args, **kwargs)
+
+
+class GatewaySnapshot(models.Model):
+    """
+    Last known copy of a gateway object, refreshed when the object is
+    created or changed and by postbacks and reconciliation.
+    """
+    pagarme_id = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        max_length=30,
+        null=True,
+        blank=True,
+    )
+    data = models.JSONField(
+        default=dict,
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+    )
+    owner_field = None
+
+    @classmethod
+    def store(cls, owner, data):
+        snapshot, _ = cls.objects.update_or_create(
+            **{cls.owner_field: owner},
+            defaults={
+                'pagarme_id': data.get('id'),
+                'status': data.get('status'),
+                'data': data,
+            },
+        )
+        return snapshot
+
+    @classmethod
+    def store_many(cls, items, merge=False):
+        """
+        Bulk version of `store` for `(owner, data)` pairs. With `merge` the
+        data is laid over the stored copy instead of replacing it.
+        """
+        items = {owner.pk: (owner, data) for owner, data in items}
+        snapshots = {
+            getattr(snapshot, f'{cls.owner_field}_id'): snapshot
+            for snapshot in cls.objects.filter(**{f'{cls.owner_field}__in': items})
+        }
+        created = []
+        for pk, (owner, data) in items.items():
+            snapshot = snapshots.get(pk)
+            if snapshot is None:
+                snapshot = cls(**{cls.owner_field: owner})
+                created.append(snapshot)
+            snapshot.data = {**snapshot.data, **data} if merge else data
+            snapshot.pagarme_id = snapshot.data.get('id')
+            snapshot.status = snapshot.data.get('status')
+            snapshot.updated_at = now()
+        cls.objects.bulk_update(snapshots.values(), ['data', 'status', 'pagarme_id', 'updated_at'])
+        cls.objects.bulk_create(created)
+
+    class Meta:
+        abstract = True
+
+
+class GatewayTransaction(GatewaySnapshot):
+    payment = models.OneToOneField(
+        Payment,
+        on_delete=models.CASCADE,
+        related_name='gateway_transaction',
+    )
+    owner_field = 'payment'
+
+
+class GatewayTransfer(GatewaySnapshot):
+    cash_out = models.OneToOneField(
+        CashOut,
+        on_delete=models.CASCADE,
+        related_name='gateway_transfer',
+    )
+    owner_field = 'cash_out'
+
+
+class PostbackEvent(models.Model):
+    PAYMENT = 'payment'
+    RECIPIENT = 'recipient'
+    KINDS = (
+        (PAYMENT, 'Payment'),
+        (RECIPIENT, 'Recipient'),
+    )
+    event_id = models.CharField(
+        max_length=40,
+        unique=True,
+    )
+    kind = models.CharField(
+        choices=KINDS,
+        max_length=10,
+    )
+    target = models.UUIDField()
+    object_id = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        max_length=30,
+        null=True,
+        blank=True,
+    )
+    payload = models.JSONField()
+    received_at = models.DateTimeField(
+        auto_now_add=True,
+    )
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='financial_postback_inbox_idx',
+                condition=models.Q(processed_at__isnull=True),
+            ),
+        ]
+
+
+class GatewayCheckpoint(models.Model):
+    """
+    Progress of a reconciliation feed. `since` is where the next run
+    starts; while a run is in progress `started_at` is set and `page` is
+    the next page to read, so an interrupted run resumes there.
+    """
+    name = models.CharField(
+        max_length=30,
+        unique=True,
+    )
+    since = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+    page = models.PositiveIntegerField(
+        default=1,
+    )
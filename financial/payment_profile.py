@@ -0,0 +1,98 @@
+"""
+Platform side of every payment: the default recipient and the split rules.
+
+The default recipient practically never changes, so it is fetched once
+per process and kept for `PAYMENT_PROFILE_TTL` seconds. After that the
+old profile is still served while a background thread refreshes it.
+"""
+import threading
+import time
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from . import gateway
+from .gateway import GatewayError
+
+# Seconds before a failed refresh is tried again.
+RETRY_AFTER = 60
+
+_profile = None
+_lock = threading.Lock()
+_refreshing = None
+
+
+def percentage(value):
+    value = float(value or 0)
+    return int(value) if value.is_integer() else value
+
+
+class PaymentProfile:
+
+    def __init__(self, default_recipients):
+        self.default_recipients = default_recipients
+        self.loaded_at = time.monotonic()
+        self.recipient_id = default_recipients.get('live' if settings.PRODUCTION else 'test')
+        commission = percentage(settings.PLATFORM_COMMISSION)
+        self.platform_rule = {
+            'recipient_id': self.recipient_id,
+            'charge_processing_fee': True,
+            'percentage': commission,
+            'charge_remainder_fee': True,
+        }
+        self.professional_rule = {
+            'charge_processing_fee': False,
+            'percentage': 100 - commission,
+            'charge_remainder_fee': False,
+        }
+
+    @classmethod
+    def load(cls):
+        return cls(gateway.default_recipient())
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.loaded_at >= settings.PAYMENT_PROFILE_TTL
+
+    def split_rules(self, recipient_id):
+        return [
+            dict(self.platform_rule),
+            {'recipient_id': recipient_id, **self.professional_rule},
+        ]
+
+
+def refresh():
+    global _profile
+    try:
+        _profile = PaymentProfile.load()
+    except (GatewayError, requests.RequestException):
+        # Keep the old profile, and try again later.
+        if _profile is not None:
+            _profile.loaded_at = time.monotonic() - settings.PAYMENT_PROFILE_TTL + RETRY_AFTER
+
+
+def get_payment_profile():
+    """
+    Returns the cached profile, loading it on first use. An expired
+    profile is returned as is while it is refreshed in the background.
+    """
+    global _profile, _refreshing
+    profile = _profile
+    if profile is None:
+        with _lock:
+            if _profile is None:
+                _profile = PaymentProfile.load()
+            return _profile
+    if profile.expired:
+        with _lock:
+            if _refreshing is None or not _refreshing.is_alive():
+                _refreshing = threading.Thread(target=refresh, name='payment-profile', daemon=True)
+                _refreshing.start()
+    return profile
+
+
+@receiver(setting_changed)
+def reset(setting=None, **kwargs):
+    global _profile
+    if setting in (None, 'PRODUCTION', 'PLATFORM_COMMISSION', 'PAGARME_API_KEY', 'PAGARME_API_URL'):
+        _profile = None
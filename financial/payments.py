@@ -0,0 +1,110 @@
+"""
+Background submission of payments.
+
+The pay endpoint only stores a pending payment. After the commit it is
+handed to a small in-process executor, and the `process_payments` worker
+picks up whatever the executor did not finish and polls the transactions
+that are still open.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, connection, models, transaction
+from django.utils.timezone import now, timedelta
+from .gateway import GatewayError, Unavailable
+from .models import Payment
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None and settings.PAYMENT_WORKERS:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.PAYMENT_WORKERS,
+            thread_name_prefix='payments',
+        )
+    return executor
+
+
+def enqueue(payment):
+    pool = get_executor()
+    if pool is not None:
+        transaction.on_commit(lambda: pool.submit(run, payment.pk))
+
+
+def run(pk):
+    close_old_connections()
+    try:
+        process(pk)
+    finally:
+        connection.close()
+
+
+def claim(pk):
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+            pk=pk,
+            status=Payment.PENDING,
+        ).select_related('client', 'client__address', 'professional', 'professional__user', 'job').first()
+        if payment is None:
+            return None
+        payment.status = Payment.SUBMITTING
+        payment.attempts = models.F('attempts') + 1
+        payment.save(update_fields=['status', 'attempts', 'registration_date'])
+    payment.refresh_from_db(fields=['attempts'])
+    return payment
+
+
+def process(pk):
+    """
+    Submits a pending payment unless another worker holds it. When the
+    request fails without an answer the payment stays submitting, since
+    the transaction may exist, and `poll` settles it. When the call was
+    not even sent it goes back to pending.
+    """
+    payment = claim(pk)
+    if payment is None:
+        return None
+    try:
+        payment.submit()
+    except (ValidationError, GatewayError) as error:
+        payment.fail(str(error))
+    except Unavailable as error:
+        Payment.objects.filter(pk=payment.pk).update(status=Payment.PENDING, error=str(error))
+    except requests.RequestException as error:
+        Payment.objects.filter(pk=payment.pk).update(error=str(error))
+    return payment
+
+
+def poll(payment):
+    """
+    Refreshes an open payment from the gateway. A submitting payment the
+    gateway never received goes back to pending, up to the retry limit.
+    """
+    try:
+        if payment.refresh_status() is not None or payment.status != Payment.SUBMITTING:
+            return payment
+    except (GatewayError, requests.RequestException):
+        return payment
+    if payment.attempts >= settings.PAYMENT_MAX_ATTEMPTS:
+        payment.fail(payment.error or 'The transaction was not created')
+    else:
+        Payment.objects.filter(pk=payment.pk, status=Payment.SUBMITTING).update(status=Payment.PENDING)
+    return payment
+
+
+def pending(grace):
+    return Payment.objects.filter(
+        status=Payment.PENDING,
+        registration_date__lte=now() - timedelta(seconds=grace),
+    ).order_by('pk').values_list('pk', flat=True)
+
+
+def open_payments(interval):
+    return Payment.objects.exclude(
+        status__in=(Payment.PENDING,) + Payment.FINAL_STATUSES,
+    ).filter(
+        registration_date__lte=now() - timedelta(seconds=interval),
+    ).select_related('client', 'professional', 'job').order_by('registration_date')
@@ -0,0 +1,127 @@
+"""
+Pagar.me postbacks.
+
+The endpoints only check the signature and append the event to the
+inbox; `consume` applies the events in batches. The event id is the
+digest of the body, so a redelivered postback is dropped by the insert.
+"""
+import hashlib
+import hmac
+import re
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.timezone import now
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from core.models import Professional
+from . import cache as pagarme_cache
+from .models import GatewayTransaction, Payment, PostbackEvent
+
+
+def verify(request):
+    algorithm, _, signature = request.headers.get('X-Hub-Signature', '').partition('=')
+    if algorithm != 'sha1' or not settings.PAGARME_API_KEY:
+        return False
+    expected = hmac.new(settings.PAGARME_API_KEY.encode(), request.body, hashlib.sha1).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def receiver(kind):
+    @csrf_exempt
+    @require_POST
+    def receive(request, uuid):
+        if not verify(request):
+            return HttpResponseForbidden()
+        payload = request.POST.dict()
+        PostbackEvent.objects.bulk_create([PostbackEvent(
+            event_id=hashlib.sha1(request.body).hexdigest(),
+            kind=kind,
+            target=uuid,
+            object_id=payload.get('id'),
+            status=payload.get('current_status'),
+            payload=payload,
+        )], ignore_conflicts=True)
+        return HttpResponse()
+    return receive
+
+
+def nested(payload):
+    """
+    Rebuilds the objects of a form encoded body, `transaction[customer][name]`
+    becoming `{'transaction': {'customer': {'name': ...}}}`.
+    """
+    data = {}
+    for key, value in payload.items():
+        *parents, name = re.findall(r'[^\[\]]+', key) or [key]
+        node = data
+        for parent in parents:
+            node = node.setdefault(parent, {})
+            if not isinstance(node, dict):
+                break
+        else:
+            node[name] = value
+    return data
+
+
+def latest(events):
+    return {event.target: event for event in sorted(events, key=lambda event: event.pk)}
+
+
+def grouped(events):
+    targets = {}
+    for event in sorted(events, key=lambda event: event.pk):
+        targets.setdefault(event.target, []).append(event)
+    return targets
+
+
+def apply_payments(events):
+    """
+    Replays the events of each payment in the order they arrived, skipping
+    the ones that would move it back, such as a late `processing` after
+    `paid`.
+    """
+    applied = {}
+    for payment in Payment.objects.filter(uuid__in=events):
+        for event in events[payment.uuid]:
+            if event.status and not payment.accepts(event.status):
+                continue
+            payment.status = event.status or payment.status
+            payment.paid = payment.status == Payment.PAID
+            if event.object_id and event.object_id.isdigit():
+                payment.pagarme_id = int(event.object_id)
+            applied[payment] = event
+    Payment.objects.bulk_update(applied, ['status', 'paid', 'pagarme_id'])
+    GatewayTransaction.store_many((
+        (payment, {
+            **nested(event.payload).get('transaction', {}),
+            'status': payment.status,
+        })
+        for payment, event in applied.items()
+    ), merge=True)
+
+
+def apply_recipients(events):
+    professionals = list(Professional.objects.filter(uuid__in=events))
+    for professional in professionals:
+        professional.recipient_status = events[professional.uuid].status
+        if professional.pagarme_id:
+            pagarme_cache.invalidate('recipient', professional.pagarme_id)
+    Professional.objects.bulk_update(professionals, ['recipient_status'])
+
+
+def consume(batch_size=100):
+    """
+    Applies a batch of unprocessed events, in order for payments and only
+    the last one per recipient, and returns how many were consumed.
+    """
+    with transaction.atomic():
+        events = list(
+            PostbackEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by('pk')[:batch_size]
+        )
+        apply_payments(grouped(event for event in events if event.kind == PostbackEvent.PAYMENT))
+        apply_recipients(latest(event for event in events if event.kind == PostbackEvent.RECIPIENT))
+        PostbackEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=now())
+    return len(events)
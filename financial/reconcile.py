@@ -0,0 +1,101 @@
+"""
+Reconciliation of payments and cash-outs with the gateway.
+
+Each feed pages through the gateway objects updated since its checkpoint
+using the list endpoints. Pages are applied one at a time, together with
+the checkpoint, so memory stays bounded and an interrupted run resumes
+from the last applied page.
+"""
+import uuid
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now, timedelta
+from . import gateway
+from .models import CashOut, GatewayCheckpoint, GatewayTransaction, GatewayTransfer, Payment
+
+PAGE_SIZE = 100
+# Reread a little before the checkpoint, in case the clocks disagree.
+OVERLAP = timedelta(minutes=5)
+CANCELED_TRANSFER_STATUSES = ('canceled', 'failed')
+
+
+def payment_uuid(transaction):
+    try:
+        return uuid.UUID(str((transaction.get('metadata') or {}).get('payment')))
+    except ValueError:
+        return None
+
+
+def apply_transactions(transactions):
+    by_id = {int(transaction['id']): transaction for transaction in transactions}
+    by_uuid = {payment_uuid(transaction): transaction for transaction in transactions}
+    by_uuid.pop(None, None)
+    payments = list(Payment.objects.filter(Q(pagarme_id__in=by_id) | Q(uuid__in=by_uuid)))
+    statuses = dict(Payment.STATUSES)
+    snapshots = []
+    for payment in payments:
+        data = by_id.get(payment.pagarme_id) or by_uuid[payment.uuid]
+        if data.get('status') in statuses:
+            payment.status = data['status']
+        payment.paid = payment.status == Payment.PAID
+        payment.pagarme_id = int(data['id'])
+        snapshots.append((payment, data))
+    Payment.objects.bulk_update(payments, ['status', 'paid', 'pagarme_id'])
+    GatewayTransaction.store_many(snapshots)
+    return len(payments)
+
+
+def apply_transfers(transfers):
+    by_id = {str(transfer['id']): transfer for transfer in transfers}
+    cash_outs = list(CashOut.objects.filter(pagarme_id__in=by_id))
+    for cash_out in cash_outs:
+        cash_out.was_withdrawn = by_id[cash_out.pagarme_id].get('status') not in CANCELED_TRANSFER_STATUSES
+    CashOut.objects.bulk_update(cash_outs, ['was_withdrawn'])
+    GatewayTransfer.store_many((cash_out, by_id[cash_out.pagarme_id]) for cash_out in cash_outs)
+    return len(cash_outs)
+
+
+FEEDS = {
+    'transactions': ('list_transactions', apply_transactions),
+    'transfers': ('list_transfers', apply_transfers),
+}
+
+
+def pages(name, checkpoint, page_size):
+    """
+    Yields the pages of a feed from the checkpoint page on, stopping after
+    the first short page.
+    """
+    fetch = getattr(gateway, FEEDS[name][0])
+    while True:
+        params = {'count': page_size, 'page': checkpoint.page}
+        if checkpoint.since is not None:
+            params['date_updated'] = f'>={int((checkpoint.since - OVERLAP).timestamp() * 1000)}'
+        objects = fetch(params)
+        yield objects
+        if len(objects) < page_size:
+            return
+
+
+def reconcile(name, page_size=PAGE_SIZE, restart=False):
+    """
+    Applies the feed from its checkpoint to the end and returns how many
+    local rows were matched. The next run starts from when this one did.
+    """
+    checkpoint, _ = GatewayCheckpoint.objects.get_or_create(name=name)
+    if restart:
+        checkpoint.since = checkpoint.started_at = None
+    if checkpoint.started_at is None:
+        checkpoint.started_at = now()
+        checkpoint.page = 1
+        checkpoint.save()
+    apply = FEEDS[name][1]
+    matched = 0
+    for objects in pages(name, checkpoint, page_size):
+        with transaction.atomic():
+            matched += apply(objects)
+            checkpoint.page += 1
+            if len(objects) < page_size:
+                checkpoint.since, checkpoint.started_at, checkpoint.page = checkpoint.started_at, None, 1
+            checkpoint.save()
+    return matched
@@ -0,0 +1,4 @@
+from . import views
+
+def register(router):
+    router.register(r'payments', views.PaymentViewSet, basename='Payment')
@@ -3,8 +3,13 @@ from . import models
 
 class PaymentSerializer(serializers.ModelSerializer):
     transaction = serializers.JSONField(read_only=True)
-    card_index = serializers.IntegerField(write_only=True)
-    
+    card_index = serializers.IntegerField(write_only=True, min_value=0)
+    status_url = serializers.SerializerMethodField('get_status_url')
+
+    def get_status_url(self, obj):
+        request = self.context['request']
+        return request.build_absolute_uri(f'/payments/{obj.uuid}/')
+
     class Meta:
         model = models.Payment
         fields = (
@@ -15,7 +20,10 @@ class PaymentSerializer(serializers.ModelSerializer):
             'job',
             'registration_date',
             'paid',
+            'status',
+            'error',
             'transaction',
+            'status_url',
             'card_index',
         )
         read_only_fields = (
@@ -26,6 +34,8 @@ class PaymentSerializer(serializers.ModelSerializer):
             'job',
             'registration_date',
             'paid',
+            'status',
+            'error',
             'transaction',
         )
 
@@ -1,18 +1,38 @@
 from django.core.exceptions import ValidationError
-from django.test import TestCase
-from .models import Payment
+from django.core.management import call_command
+from django.test import Client, TestCase
+from io import StringIO
+from django.test.utils import override_settings
+from urllib.parse import urlencode
+import hashlib
+import hmac
+import re
+from .models import CashOut, GatewayCheckpoint, Payment, PostbackEvent
 from django.contrib.auth import get_user_model
-from core.models import Professional
+from core.models import Address, Professional
 from services.models import Job, Proposal
+from django.conf import settings
 from django.utils import timezone
+from mock import Mock, patch
+import requests
+import threading
+import time
+from django.core.cache import cache
+from . import cache as pagarme_cache, gateway, payment_profile, payments, postbacks, reconcile
+from .fake_gateway import FakePagarme
 
 User = get_user_model()
 TODAY = timezone.now()
 timedelta = timezone.timedelta
 
-class TestPayment(TestCase):
+
+class PaymentFixtures:
+    """
+    A client, a professional and an accepted job with its pending payment.
+    """
 
     def setUp(self):
+        super().setUp()
         self.client = User(
             email='tete@tete.com',
             password='senha',
@@ -56,7 +76,10 @@ class TestPayment(TestCase):
         )
         self.payment.full_clean()
         self.payment.save()
-    
+
+
+class TestPayment(PaymentFixtures, TestCase):
+
     def test_payment(self):
         self.payment.full_clean()
 
@@ -66,4 +89,490 @@ class TestPayment(TestCase):
 
     def test_cash(self):
         self.assertEqual(self.professional.cash, 300)
-        
\ No newline at end of file
+
+
+@patch('financial.gateway.default_recipient', return_value={'test': 're_platform'})
+@patch('financial.gateway.get_recipient', return_value={'id': 're_professional'})
+@patch('financial.gateway.list_cards', return_value=[{'id': 'card_1'}])
+@patch('financial.gateway.get_customer', return_value={'phone_numbers': ['+5531999999999']})
+class TestPaymentPipeline(PaymentFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        payment_profile.reset()
+        User.objects.filter(pk=self.client.pk).update(saved_in_pagarme=True, pagarme_id=1)
+        Professional.objects.filter(pk=self.professional.pk).update(saved_in_pagarme=True, pagarme_id='re_professional')
+        Address.objects.create(
+            user=self.client,
+            street='Rua',
+            street_number='1',
+            zipcode='30000-000',
+            state='MG',
+            city='Belo Horizonte',
+            complementary='',
+        )
+
+    def process(self):
+        return payments.process(self.payment.pk)
+
+    @patch('financial.gateway.find_transactions', return_value=[{'id': 10, 'status': 'paid'}])
+    @patch('financial.gateway.create_transaction', return_value={'id': 10, 'status': 'processing'})
+    def test_process(self, create_transaction, *mocks):
+        payment = self.process()
+        self.assertEqual((payment.status, payment.pagarme_id, payment.attempts), ('processing', 10, 1))
+        self.assertEqual(Payment.objects.get(pk=payment.pk).transaction, {'id': 10, 'status': 'processing'})
+        self.assertTrue(create_transaction.call_args.args[0]['async'])
+        self.assertIsNone(self.process())
+        payments.poll(payment)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PAID)
+        self.assertTrue(self.payment.paid)
+
+    @override_settings(PLATFORM_COMMISSION='15')
+    @patch('financial.gateway.create_transaction', return_value={'id': 10, 'status': 'processing'})
+    def test_split_rules(self, create_transaction, get_customer, list_cards, get_recipient, default_recipient):
+        self.process()
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.PENDING)
+        self.process()
+        self.assertEqual(default_recipient.call_count, 1)
+        self.assertEqual(create_transaction.call_args.args[0]['split_rules'], [
+            {'recipient_id': 're_platform', 'charge_processing_fee': True, 'percentage': 15, 'charge_remainder_fee': True},
+            {'recipient_id': 're_professional', 'charge_processing_fee': False, 'percentage': 85, 'charge_remainder_fee': False},
+        ])
+
+    @patch('financial.gateway.create_transaction', side_effect=gateway.GatewayError([{'message': 'Refused'}], 400))
+    def test_process_failure(self, *mocks):
+        payment = self.process()
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertIn('Refused', payment.error)
+
+    @patch('financial.gateway.create_transaction', side_effect=gateway.Unavailable('Circuit open'))
+    def test_process_unavailable(self, *mocks):
+        self.process()
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.error), (Payment.PENDING, 'Circuit open'))
+
+    @patch('financial.gateway.find_transactions', return_value=[])
+    @patch('financial.gateway.create_transaction', side_effect=requests.ReadTimeout('timed out'))
+    def test_lost_submission(self, *mocks):
+        self.process()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.SUBMITTING)
+        payments.poll(self.payment)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PENDING)
+        Payment.objects.filter(pk=self.payment.pk).update(attempts=settings.PAYMENT_MAX_ATTEMPTS)
+        self.process()
+        self.payment.refresh_from_db()
+        payments.poll(self.payment)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.FAILED)
+
+    @patch('financial.gateway.create_transaction', return_value={'id': 10, 'status': 'paid'})
+    def test_process_command(self, *mocks):
+        out = StringIO()
+        call_command('process_payments', once=True, interval=0, stdout=out)
+        self.assertEqual(out.getvalue().strip(), '1 payments submitted, 0 payments polled')
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.paid)
+
+    def test_payment_status(self, *mocks):
+        client = Client()
+        url = f'/payments/{self.payment.uuid}.json'
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        client.force_login(self.user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['status'], Payment.PENDING)
+        client.force_login(User.objects.create(email='other@tete.com', is_active=True))
+        self.assertEqual(client.get(url).status_code, 404)
+        
+
+
+class TestFakeGateway(PaymentFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        gateway.breakers.clear()
+        self.fake = FakePagarme(api_key='ak_test_fake', deliver_postbacks=False).start()
+        self.addCleanup(self.fake.stop)
+        settings = override_settings(PAGARME_API_URL=self.fake.url, PAGARME_API_KEY='ak_test_fake')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        customer = gateway.create_customer({'name': 'Fulano', 'phone_numbers': ['+5531999999999']})
+        self.client.saved_in_pagarme = True
+        self.client.pagarme_id = customer['id']
+        self.client.save(update_fields=['saved_in_pagarme', 'pagarme_id'])
+        self.client.create_card({'card_number': '4111111111111111', 'card_holder_name': 'FULANO'})
+        Address.objects.create(
+            user=self.client,
+            street='Rua',
+            street_number='1',
+            zipcode='30000-000',
+            state='MG',
+            city='Belo Horizonte',
+            complementary='',
+        )
+
+    def replay(self, postback):
+        url, body, headers = postback
+        return Client().post(
+            re.sub(r'^\w+://[^/]+', '', url), body,
+            content_type=headers['Content-Type'],
+            HTTP_X_HUB_SIGNATURE=headers['X-Hub-Signature'],
+        )
+
+    def test_payment_flow(self):
+        self.professional.create_recipient('0001', '1', '341', '12345', '6', 'Fulano de tal')
+        self.assertEqual(self.professional.recipient['status'], 'active')
+        payment = payments.process(self.payment.pk)
+        self.assertEqual(payment.status, 'processing')
+        self.assertEqual(payment.transaction['metadata']['payment'], str(self.payment.uuid))
+        self.assertEqual([transaction['id'] for transaction in gateway.find_transactions(
+            {'metadata': {'payment': str(self.payment.uuid)}},
+        )], [payment.pagarme_id])
+        for postback in self.fake.postbacks:
+            self.assertEqual(self.replay(postback).status_code, 200)
+        self.assertEqual(postbacks.consume(), 2)
+        self.payment.refresh_from_db()
+        self.professional.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.paid), (Payment.PAID, True))
+        self.assertEqual(self.professional.recipient_status, 'active')
+
+    @patch('financial.gateway.time.sleep')
+    def test_error_injection(self, sleep):
+        Professional.objects.filter(pk=self.professional.pk).update(saved_in_pagarme=True, pagarme_id='re_professional')
+        self.fake.error_rate = 1
+        with self.assertRaises(gateway.GatewayError) as context:
+            gateway.get_customer(self.client.pagarme_id)
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(sleep.call_count, gateway.RETRIES)
+        self.assertEqual(payments.process(self.payment.pk).status, Payment.FAILED)
+
+    def test_authentication(self):
+        with override_settings(PAGARME_API_KEY='ak_wrong'):
+            with self.assertRaises(gateway.GatewayError) as context:
+                gateway.default_recipient()
+        self.assertEqual(context.exception.status, 401)
+        self.assertEqual(gateway.default_recipient()['test'], 're_default_test')
+
+    def test_reconcile(self):
+        Professional.objects.filter(pk=self.professional.pk).update(saved_in_pagarme=True, pagarme_id='re_professional')
+        self.professional.refresh_from_db(fields=['pagarme_id'])
+        for value in (100, 200):
+            gateway.create_transaction({'amount': value, 'metadata': {'payment': 'other'}})
+        gateway.create_transaction({'amount': 30000, 'metadata': {'payment': str(self.payment.uuid)}})
+        cash_out = CashOut.create_withdraw(self.professional)
+        gateway.cancel_transfer(cash_out.pagarme_id)
+        list_transactions = gateway.list_transactions
+        calls = []
+
+        def interrupted(params):
+            calls.append(params)
+            if len(calls) == 2:
+                raise requests.ConnectionError('connection reset')
+            return list_transactions(params)
+        with patch('financial.gateway.list_transactions', side_effect=interrupted):
+            with self.assertRaises(requests.ConnectionError):
+                reconcile.reconcile('transactions', page_size=1)
+        checkpoint = GatewayCheckpoint.objects.get(name='transactions')
+        self.assertEqual((checkpoint.page, checkpoint.since), (2, None))
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.paid)
+        out = StringIO()
+        call_command('reconcile_gateway', page_size=1, stdout=out)
+        self.assertEqual(out.getvalue().split('\n')[:2], ['0 transactions reconciled', '1 transfers reconciled'])
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.page, checkpoint.started_at), (1, None))
+        self.assertIsNotNone(checkpoint.since)
+        with patch('financial.gateway.list_transactions', wraps=list_transactions) as listed:
+            reconcile.reconcile('transactions')
+        self.assertIn('date_updated', listed.call_args.args[0])
+        cash_out.refresh_from_db()
+        self.assertFalse(cash_out.was_withdrawn)
+        self.assertEqual(cash_out.transfer['status'], 'canceled')
+        self.assertEqual(self.payment.transaction['amount'], 30000)
+
+
+@patch('financial.gateway.default_recipient', return_value={'live': 're_live', 'test': 're_test'})
+class TestPaymentProfile(TestCase):
+
+    def setUp(self):
+        payment_profile.reset()
+
+    def test_cached(self, default_recipient):
+        profile = payment_profile.get_payment_profile()
+        self.assertIs(payment_profile.get_payment_profile(), profile)
+        self.assertEqual(profile.recipient_id, 're_test')
+        self.assertEqual(default_recipient.call_count, 1)
+        with override_settings(PRODUCTION=True):
+            self.assertEqual(payment_profile.get_payment_profile().recipient_id, 're_live')
+
+    def test_background_refresh(self, default_recipient):
+        profile = payment_profile.get_payment_profile()
+        profile.loaded_at -= settings.PAYMENT_PROFILE_TTL
+        self.assertIs(payment_profile.get_payment_profile(), profile)
+        payment_profile._refreshing.join()
+        self.assertIsNot(payment_profile.get_payment_profile(), profile)
+        self.assertEqual(default_recipient.call_count, 2)
+
+    def test_failed_refresh_keeps_profile(self, default_recipient):
+        profile = payment_profile.get_payment_profile()
+        profile.loaded_at -= settings.PAYMENT_PROFILE_TTL
+        default_recipient.side_effect = gateway.Unavailable('open')
+        payment_profile.get_payment_profile()
+        payment_profile._refreshing.join()
+        self.assertIs(payment_profile.get_payment_profile(), profile)
+        self.assertFalse(profile.expired)
+
+
+def gateway_response(status, body):
+    return Mock(status_code=status, ok=status < 400, json=Mock(return_value=body))
+
+@patch('financial.gateway.time.sleep')
+class TestGateway(TestCase):
+
+    def setUp(self):
+        gateway.breakers.clear()
+
+    def test_session_is_shared(self, sleep):
+        self.assertIs(gateway.get_session(), gateway.get_session())
+
+    @patch('requests.Session.request')
+    def test_get_retries(self, request, sleep):
+        request.side_effect = [
+            requests.ConnectTimeout(),
+            gateway_response(503, {}),
+            gateway_response(200, {'id': 're_1'}),
+        ]
+        self.assertEqual(gateway.get_recipient('re_1'), {'id': 're_1'})
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        method, url = request.call_args.args
+        self.assertEqual((method, url), ('GET', 'https://api.pagar.me/1/recipients/re_1'))
+        self.assertEqual(request.call_args.kwargs['timeout'], gateway.TIMEOUTS['read'])
+
+    @patch('requests.Session.request')
+    def test_get_gives_up(self, request, sleep):
+        request.side_effect = requests.ReadTimeout()
+        self.assertRaises(requests.ReadTimeout, gateway.get_transfer, 1)
+        self.assertEqual(request.call_count, 1 + gateway.RETRIES)
+
+    @patch('requests.Session.request')
+    def test_post_is_not_retried(self, request, sleep):
+        request.return_value = gateway_response(502, {'errors': [{'message': 'Bad gateway'}]})
+        with self.assertRaises(gateway.GatewayError) as context:
+            gateway.create_transaction({'amount': 100})
+        self.assertEqual(context.exception.status, 502)
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(request.call_args.kwargs['timeout'], gateway.TIMEOUTS['transaction'])
+        sleep.assert_not_called()
+
+    @override_settings(PAGARME_BREAKER_THRESHOLD=2)
+    @patch('requests.Session.request')
+    def test_circuit_breaker(self, request, sleep):
+        request.return_value = gateway_response(503, {})
+        for _ in range(2):
+            self.assertRaises(gateway.GatewayError, gateway.create_transfer, {'amount': 100})
+        breaker = gateway.breakers['transfers']
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertRaises(gateway.Unavailable, gateway.create_transfer, {'amount': 100})
+        self.assertRaises(gateway.Unavailable, gateway.get_transfer, 1)
+        self.assertEqual(request.call_count, 2)
+        request.return_value = gateway_response(200, {'id': 're_1'})
+        self.assertEqual(gateway.get_recipient('re_1'), {'id': 're_1'})
+        breaker.opened_at -= breaker.reset
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        request.return_value = gateway_response(200, {'id': 1})
+        self.assertEqual(gateway.get_transfer(1), {'id': 1})
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    @patch('requests.Session.request')
+    def test_half_open_probe_fails(self, request, sleep):
+        breaker = gateway.get_breaker('customers')
+        breaker.opened_at = time.monotonic() - breaker.reset
+        request.side_effect = requests.ConnectTimeout()
+        self.assertRaises(requests.ConnectTimeout, gateway.create_customer, {})
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertRaises(gateway.Unavailable, gateway.create_customer, {})
+        self.assertEqual(request.call_count, 1)
+
+    @patch('requests.Session.request')
+    def test_concurrency_cap(self, request, sleep):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with patch('financial.gateway.get_slots', return_value=slots):
+            self.assertRaises(gateway.Unavailable, gateway.get_customer, 1)
+        request.assert_not_called()
+        sleep.assert_not_called()
+
+
+class TestPagarmeCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lookup_and_invalidate(self):
+        fetch = Mock(side_effect=lambda pagarme_id: {'id': pagarme_id})
+        with patch('financial.gateway.get_customer', fetch):
+            self.assertEqual(pagarme_cache.lookup('customer', 1), {'id': 1})
+            self.assertEqual(pagarme_cache.lookup('customer', 1), {'id': 1})
+            self.assertEqual(fetch.call_count, 1)
+            pagarme_cache.invalidate('customer', 1)
+            pagarme_cache.lookup('customer', 1)
+            self.assertEqual(fetch.call_count, 2)
+
+    def test_single_flight(self):
+        release = threading.Event()
+        fetch = Mock(side_effect=lambda pagarme_id: release.wait(5) and [{'id': 'card_1'}])
+        results = []
+        with patch('financial.gateway.list_cards', fetch):
+            threads = [
+                threading.Thread(target=lambda: results.append(pagarme_cache.lookup('cards', 1)))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            while not pagarme_cache.flights.calls:
+                release.wait(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [[{'id': 'card_1'}]] * 5)
+        self.assertEqual(fetch.call_count, 1)
+
+    @patch('financial.gateway.create_card', return_value={'id': 'card_2'})
+    def test_create_card_invalidates(self, create_card):
+        cache.set(pagarme_cache.cache_key('cards', 7), [{'id': 'card_1'}])
+        user = User(email='cards@tete.com', saved_in_pagarme=True, pagarme_id=7)
+        self.assertEqual(user.cards, [{'id': 'card_1'}])
+        user.create_card({'card_hash': 'hash'})
+        with patch('financial.gateway.list_cards', return_value=[{'id': 'card_2'}]):
+            self.assertEqual(user.cards, [{'id': 'card_2'}])
+
+    def test_stale_copy(self):
+        with patch('financial.gateway.get_recipient', return_value={'id': 're_1'}):
+            pagarme_cache.lookup('recipient', 're_1')
+        pagarme_cache.invalidate('recipient', 're_1')
+        with patch('financial.gateway.get_recipient', side_effect=gateway.Unavailable('open')):
+            self.assertEqual(pagarme_cache.lookup('recipient', 're_1'), {'id': 're_1'})
+            self.assertRaises(gateway.Unavailable, pagarme_cache.lookup, 'recipient', 're_2')
+
+    @patch('financial.gateway.get_customer', side_effect=gateway.Unavailable('open'))
+    def test_profile_degrades(self, get_customer):
+        user = User.objects.create(
+            email='profile@tete.com',
+            is_active=True,
+            saved_in_pagarme=True,
+            pagarme_id=9,
+        )
+        client = Client()
+        client.force_login(user)
+        response = client.get('/profile.json?expand=customer')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['customer'])
+        self.assertEqual(client.get('/profile/customer.json').status_code, 503)
+
+    @patch('financial.gateway.get_recipient', return_value={'id': 're_9'})
+    @patch('financial.gateway.get_customer', return_value={'id': 9})
+    def test_profile_expand(self, get_customer, get_recipient):
+        user = User.objects.create(
+            email='profile@tete.com',
+            is_active=True,
+            saved_in_pagarme=True,
+            pagarme_id=9,
+        )
+        Professional.objects.create(user=user, saved_in_pagarme=True, pagarme_id='re_9', coren='10.001')
+        client = Client()
+        client.force_login(user)
+        data = client.get('/profile.json').json()
+        self.assertNotIn('customer', data)
+        self.assertNotIn('recipient', data['professional'])
+        self.assertNotIn('cash', data['professional'])
+        get_customer.assert_not_called()
+        get_recipient.assert_not_called()
+        data = client.get('/profile.json?expand=customer,recipient,cash').json()
+        self.assertEqual(data['customer'], {'id': 9})
+        self.assertEqual(data['professional']['recipient'], {'id': 're_9'})
+        self.assertEqual(data['professional']['cash'], 0)
+        self.assertEqual((get_customer.call_count, get_recipient.call_count), (1, 1))
+        self.assertEqual(client.get('/profile.json?expand=password').status_code, 400)
+
+
+@override_settings(PAGARME_API_KEY='ak_test_postback')
+class TestPostbacks(PaymentFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.professional.pagarme_id = 're_professional'
+        self.professional.save()
+
+    def postback(self, url, signature=None, **data):
+        body = urlencode(data)
+        if signature is None:
+            signature = hmac.new(b'ak_test_postback', body.encode(), hashlib.sha1).hexdigest()
+        return Client().post(
+            url, body,
+            content_type='application/x-www-form-urlencoded',
+            HTTP_X_HUB_SIGNATURE=f'sha1={signature}',
+        )
+
+    def test_payment_postback(self):
+        url = f'/postback/payment/{self.payment.uuid}/'
+        event = {
+            'id': '1234',
+            'object': 'transaction',
+            'old_status': 'processing',
+            'current_status': 'paid',
+            'transaction[id]': '1234',
+            'transaction[status]': 'paid',
+            'transaction[customer][name]': 'Fulano',
+        }
+        self.assertEqual(self.postback(url, **event).status_code, 200)
+        self.assertEqual(self.postback(url, **event).status_code, 200)
+        self.assertEqual(self.postback(url, signature='0' * 40, **event).status_code, 403)
+        self.assertEqual(Client().get(url).status_code, 405)
+        self.assertEqual(PostbackEvent.objects.count(), 1)
+        self.assertEqual(postbacks.consume(), 1)
+        self.assertEqual(postbacks.consume(), 0)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.paid, self.payment.pagarme_id), ('paid', True, 1234))
+        self.assertEqual(self.payment.transaction, {'id': '1234', 'status': 'paid', 'customer': {'name': 'Fulano'}})
+
+    def test_out_of_order_payment_postbacks(self):
+        url = f'/postback/payment/{self.payment.uuid}/'
+        for status in ('paid', 'processing'):
+            self.postback(url, id='1234', object='transaction', current_status=status)
+        self.assertEqual(postbacks.consume(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.paid), ('paid', True))
+        self.postback(url, id='1234', object='transaction', current_status='authorized')
+        self.postback(url, id='1234', object='transaction', current_status='refunded')
+        self.assertEqual(postbacks.consume(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.paid), ('refunded', False))
+        self.assertEqual(self.payment.transaction['status'], 'refunded')
+
+    def test_recipient_postback(self):
+        url = f'/postback/professional/{self.professional.uuid}/'
+        for status in ('registration', 'active'):
+            self.postback(url, id='re_professional', object='recipient', current_status=status)
+        out = StringIO()
+        call_command('consume_postbacks', once=True, stdout=out)
+        self.assertEqual(out.getvalue().strip(), '2 postbacks consumed')
+        self.professional.refresh_from_db()
+        self.assertEqual(self.professional.recipient_status, 'active')
+
+    @patch('financial.gateway.get_transfer', side_effect=AssertionError('Remote call'))
+    @patch('financial.gateway.cancel_transfer', return_value={'id': 123456789, 'status': 'canceled'})
+    @patch('financial.gateway.create_transfer', return_value={'id': 123456789, 'status': 'pending_transfer'})
+    def test_transfer_mirror(self, *mocks):
+        cash_out = CashOut.create_withdraw(self.professional)
+        cash_out = CashOut.objects.select_related('gateway_transfer').get(pk=cash_out.pk)
+        self.assertEqual((cash_out.pagarme_id, cash_out.transfer['status']), ('123456789', 'pending_transfer'))
+        cash_out.cancel_withdraw()
+        cash_out.refresh_from_db()
+        self.assertFalse(cash_out.was_withdrawn)
+        self.assertEqual(cash_out.transfer['status'], 'canceled')
@@ -1,6 +1,25 @@
-from django.shortcuts import render
+from django.db.models import Q
+from django.shortcuts import get_object_or_404
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSet
+from . import models, postbacks, serializers
 
-# Create your views here.
+payment_postback = postbacks.receiver(models.PostbackEvent.PAYMENT)
 
-def payment_postback(request, uuid):
-    pass
\ No newline at end of file
+class PaymentViewSet(ViewSet):
+    serializer_class = serializers.PaymentSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'uuid'
+
+    @property
+    def queryset(self):
+        return models.Payment.objects.filter(
+            Q(client=self.request.user) |
+            Q(professional__user=self.request.user)
+        ).select_related('gateway_transaction')
+
+    def retrieve(self, request, uuid, *args, **kwargs):
+        payment = get_object_or_404(self.queryset, uuid=uuid)
+        serializer = self.serializer_class(payment, context={'request': request})
+        return Response(serializer.data)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from core.models import Professional
+from services.models import Rating
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the rating sum and count of the professionals from their ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        ratings = Rating.objects.filter(
+            job__professional=models.OuterRef('pk'),
+        ).order_by().values('job__professional')
+        rating_sum = ratings.annotate(total=models.Sum('grade')).values('total')
+        rating_count = ratings.annotate(total=models.Count('pk')).values('total')
+        last = Professional.objects.aggregate(last=models.Max('pk'))['last'] or 0
+        updated = 0
+        for start in range(0, last, batch_size):
+            with transaction.atomic():
+                updated += Professional.objects.filter(
+                    pk__gt=start,
+                    pk__lte=start + batch_size,
+                ).update(
+                    rating_sum=Coalesce(models.Subquery(rating_sum), 0),
+                    rating_count=Coalesce(models.Subquery(rating_count), 0),
+                )
+        self.stdout.write(f'{updated} professionals updated')
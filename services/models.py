@@ -1,3 +1,4 @@
+from financial import payments
 from financial.models import Payment
 from django.utils import timezone
 from django.core.exceptions import ValidationError
@@ -117,10 +118,12 @@ class Job(models.Model):
                 professional=self.professional,
                 value=self.value,
                 job=self,
+                card_index=card_index,
             )
             payment.full_clean()
+            payment.validate_payer()
             payment.save()
-            payment.pay(card_index)
+            payments.enqueue(payment)
             return payment
 
     def validate_client(self):
@@ -0,0 +1,25 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.cache import bump_search_version
+from core.models import Professional
+from . import models
+
+
+@receiver(post_save, sender=models.Rating)
+def rating_created(sender, instance, created, **kwargs):
+    if created:
+        Professional.objects.filter(jobs=instance.job_id).update(
+            rating_sum=F('rating_sum') + instance.grade,
+            rating_count=F('rating_count') + 1,
+        )
+        bump_search_version()
+
+
+@receiver(post_delete, sender=models.Rating)
+def rating_deleted(sender, instance, **kwargs):
+    Professional.objects.filter(jobs=instance.job_id).update(
+        rating_sum=F('rating_sum') - instance.grade,
+        rating_count=F('rating_count') - 1,
+    )
+    bump_search_version()
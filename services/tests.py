@@ -7,6 +7,10 @@ from django.contrib.auth import get_user_model
 from rest_framework import response
 from core.models import Address, Professional
 from .models import CounterProposal, Job, Proposal, Rating
+from financial import payments
+from api.testing import QueryBudgetMixin
+from django.core.management import call_command
+from io import StringIO
 
 User = get_user_model()
 TODAY = timezone.now()
@@ -137,8 +141,35 @@ class TestRating(TestCase):
         )
         rating.full_clean()
         rating.save()
+        self.professional.refresh_from_db()
         self.assertEqual(self.professional.avg_rating, 4)
 
+    def test_rating_aggregates(self):
+        rating = Rating.objects.create(
+            client=self.client,
+            job=self.proposal.job,
+            grade=3,
+        )
+        professional = Professional.objects.with_rating().get(pk=self.professional.pk)
+        self.assertEqual((professional.rating_sum, professional.rating_count), (3, 1))
+        self.assertEqual(professional.rating, 3)
+        Professional.objects.filter(pk=self.professional.pk).update(rating_sum=0, rating_count=0)
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.professional.refresh_from_db()
+        self.assertEqual((self.professional.rating_sum, self.professional.rating_count), (3, 1))
+        rating.delete()
+        self.professional.refresh_from_db()
+        self.assertEqual((self.professional.rating_sum, self.professional.rating_count), (0, 0))
+        self.assertEqual(self.professional.avg_rating, None)
+
+    def test_save_keeps_rating(self):
+        stale = Professional.objects.get(pk=self.professional.pk)
+        Rating.objects.create(client=self.client, job=self.proposal.job, grade=5)
+        stale.about = 'Updated'
+        stale.save()
+        self.professional.refresh_from_db()
+        self.assertEqual((self.professional.about, self.professional.rating_count), ('Updated', 1))
+
 class TestProposalREST(TestCase):
 
     def setUp(self):
@@ -480,10 +511,80 @@ class TestJobs(TestCase):
         self.client.login(request=HttpRequest(), username=self.user.email, password='abda1234')
         data = {'card_index': 0}
         response = self.client.post(f'/jobs/{self.proposal.job.uuid}/pay.json', data=data, content_type='application/json')
-        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.status_code, 202, response.content)
         self.assertEqual(response.get('Content-Type'), 'application/json', response.content)
         self.assertIn('uuid', response.json())
-        self.assertIn('transaction', response.json())
-        self.assertIn('id', response.json()['transaction'])
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertEqual(response['Location'], response.json()['status_url'])
         job:Job = Job.objects.get(uuid=str(self.proposal.job.uuid))
-        self.assertTrue(job.paid)
\ No newline at end of file
+        payments.process(job.payment.pk)
+        job.payment.refresh_from_db()
+        self.assertNotEqual(job.payment.status, 'failed', job.payment.error)
+
+
+class TestQueryBudget(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.professional = Professional.objects.create(
+            user=User.objects.create_user(
+                email='budget@balance.com',
+                password='abda143501',
+                is_active=True,
+            )
+        )
+        self.user = User.objects.create_user(
+            email='budget@bola.com',
+            password='abda1234',
+            is_active=True,
+        )
+
+    def seed_proposals(self, amount):
+        return Proposal.objects.bulk_create(
+            Proposal(
+                client=self.user,
+                professional=self.professional,
+                city='Curitiba',
+                state='PR',
+                professional_type='AE',
+                service_type='AC',
+                start_datetime=TODAY + timedelta(days=1),
+                end_datetime=TODAY + timedelta(days=3),
+                value=300.00,
+                description='Lorem Ipsum dolores'
+            )
+            for _ in range(amount)
+        )
+
+    def seed_jobs(self, amount):
+        jobs = Job.objects.bulk_create(
+            Job(
+                proposal=proposal,
+                client=self.user,
+                professional=self.professional,
+                value=300,
+                start_datetime=TODAY + timedelta(days=1),
+                end_datetime=TODAY + timedelta(days=2),
+            )
+            for proposal in self.seed_proposals(amount)
+        )
+        Rating.objects.bulk_create(
+            Rating(client=self.user, job=job, grade=5)
+            for job in jobs[::2]
+        )
+
+    def test_proposals(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(self.seed_jobs, '/proposals.json')
+        self.assertConstantQueries(self.seed_proposals, '/proposals/sent.json')
+
+    def test_received_proposals(self):
+        self.client.force_login(self.professional.user)
+        self.assertConstantQueries(self.seed_jobs, '/proposals/received.json')
+
+    def test_jobs(self):
+        self.client.force_login(self.professional.user)
+        self.assertConstantQueries(self.seed_jobs, '/jobs.json')
+
+    def test_hires(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(self.seed_jobs, '/jobs/hires.json')
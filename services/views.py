@@ -9,6 +9,7 @@ from rest_framework.viewsets import ViewSet
 from rest_framework.permissions import IsAuthenticated
 from core.views import IsProfessional
 from django.utils.translation import gettext as _
+from django.core.exceptions import ValidationError
 import financial.models
 import financial.serializers
 
@@ -16,13 +17,14 @@ class ProposalsViewSet(ViewSet):
     serializer_class = serializers.ProposalSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'uuid'
+    select_related = ('client', 'professional', 'job')
 
     @property    
     def queryset(self):
         return models.Proposal.objects.filter(
             Q(client=self.request.user) |
             Q(professional__user=self.request.user)
-        ).all()
+        ).select_related(*self.select_related)
 
     @property
     def object(self):
@@ -187,6 +189,7 @@ class JobViewSet(ViewSet):
     permission_classes = [IsAuthenticated]
     lookup_field = 'uuid'
     professional_actions = ('list',)
+    select_related = ('proposal', 'client', 'professional', 'rate')
 
     def get_permissions(self):
         if self.action in self.professional_actions:
@@ -198,11 +201,11 @@ class JobViewSet(ViewSet):
         return models.Job.objects.filter(
             Q(professional__user=self.request.user, proposal__professional__user=self.request.user) |
             Q(client=self.request.user, proposal__client=self.request.user)
-        ).all()
+        ).select_related(*self.select_related)
 
     def list(self, request, *args, **kwargs):
         serializer = self.serializer_class(
-            request.user.professional.jobs.all(),
+            request.user.professional.jobs.select_related(*self.select_related),
             many=True,
             context={'request': request}
         )
@@ -211,7 +214,7 @@ class JobViewSet(ViewSet):
     @action(methods=['get'], detail=False)
     def hires(self, request, *args, **kwargs):
         serializer = self.serializer_class(
-            request.user.hires.all(),
+            request.user.hires.select_related(*self.select_related),
             many=True,
             context={'request': request}
         )
@@ -271,7 +274,11 @@ class JobViewSet(ViewSet):
             context={'request': request}
         )
         if serializer.is_valid():
-            payment = job.pay(**serializer.validated_data)
+            try:
+                payment = job.pay(**serializer.validated_data)
+            except ValidationError as error:
+                return Response({'error': error.messages}, status=400)
             serializer.instance = payment
-            return Response(serializer.data)
+            data = serializer.data
+            return Response(data, status=202, headers={'Location': data['status_url']})
         return Response(serializer.errors, status=400)
\ No newline at end of file